@@ -4,6 +4,14 @@ from enum import Enum
 from furl import furl
 from pydantic import AnyUrl, BaseModel, SecretStr, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy.engine import URL, make_url
+
+
+ASYNC_DRIVERS = {
+    "postgresql": "psycopg",
+    "sqlite": "aiosqlite",
+    "mysql": "aiomysql",
+}
 
 
 class Mode(str, Enum):
@@ -18,17 +26,30 @@ class MailProvider(str, Enum):
 
 class SendgridSettings(BaseModel):
     api_key: SecretStr | None = None
+    host: str = "https://api.sendgrid.com"
+    timeout: float = 30
 
 
 class SmtpSettings(BaseModel):
     host: str = "localhost"
+    port: int = 0  # The default port for the protocol
+    ssl: bool = True
     username: str | None = None
     password: SecretStr | None = None
+    timeout: float = 30
+    max_messages_per_connection: int = 100
 
 
 class MailSettings(BaseModel):
     provider: MailProvider = MailProvider.SMTP
     sender_email: str | None = None
+    batch_size: int = 30
+    concurrency: int = 4
+    lease_time: float = 300
+    max_attempts: int = 5
+    retry_delay: float = 60
+    retention_days: float = 30
+    purge_batch_size: int = 1000
 
     sendgrid: SendgridSettings = Field(default_factory=SendgridSettings)
     smtp: SmtpSettings = Field(default_factory=SmtpSettings)
@@ -51,6 +72,39 @@ class DatabaseSettings(BaseModel):
             url.scheme = "postgresql"
         return str(url)
 
+    def async_dsn(self) -> URL:
+        """The dsn, with the driver replaced by the async driver for the same database"""
+        url = make_url(str(self.dsn()))
+        backend = url.get_backend_name()
+        return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+class TemplateSettings(BaseModel):
+    bytecode_cache_dir: str | None = None
+    precompiled_dir: str | None = None
+
+
+class CacheSettings(BaseModel):
+    catalog_max_age: int = 60
+    fragment_size: int = 4096
+    jwks_max_age: int = 60 * 60
+    token_size: int = 1024
+    user_max_age: int = 60
+    user_size: int = 1024
+    snapshot_size: int = 256
+
+
+class WorkerSettings(BaseModel):
+    poll_min: float = 1
+    poll_max: float = 30
+    sync_interval: float = 24 * 60 * 60  # Zero disables syncing sessions in the worker
+    # Sync more often in the months sessions change, keyed by month number
+    sync_intervals: dict[int, float] = {9: 10 * 60}
+    purge_interval: float = 60 * 60
+
+    def sync_interval_for(self, date: datetime.date) -> float:
+        return self.sync_intervals.get(date.month, self.sync_interval)
+
 
 class GoogleOAuthSettings(BaseModel):
     client_id: str
@@ -64,8 +118,12 @@ class Settings(BaseSettings):
     database: DatabaseSettings = Field(default_factory=DatabaseSettings)
     oauth: GoogleOAuthSettings = Field(default_factory=GoogleOAuthSettings)
     mail: MailSettings = Field(default_factory=MailSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    templates: TemplateSettings = Field(default_factory=TemplateSettings)
+    worker: WorkerSettings = Field(default_factory=WorkerSettings)
     year: int = datetime.date.today().year
     root_path: str = ""
+    base_url: str = "http://localhost:3000"  # Where users reach the web app, including any root path
     update_generation: int = 0
 
     model_config = SettingsConfigDict(env_nested_delimiter="__")
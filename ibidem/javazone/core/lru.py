@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRU(Generic[K, V]):
+    """A bounded mapping that drops the least recently used entries first, safe to share between threads
+
+    Entries may be given a time they expire at, as told by clock, after which they are no longer returned.
+    """
+
+    def __init__(self, size: int, clock: Callable[[], float] = time.monotonic):
+        self._size = size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, tuple[Optional[float], V]] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            expires_at, value = cached
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V, expires_at: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,23 +1,165 @@
 import functools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import Executable, String, Table, Uuid, create_engine, event, func, inspect, literal, or_, select, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateColumn
 
 from ibidem.javazone.core.config import settings
 
+LOG = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+_query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
 @functools.cache
 def init():
     from ibidem.javazone.database import models  # NOQA F401: Imported here for side effect of loading Base subclasses
 
     engine = create_engine(settings.database.dsn(), pool_pre_ping=True, pool_size=10, max_overflow=20)
+    event.listen(engine, "before_cursor_execute", _count_query)
     Base.metadata.create_all(engine)
+    _migrate(engine)
     return sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 def get_session():
     session_maker = init()
     return session_maker()
+
+
+@functools.cache
+def init_async():
+    """Session maker for the async engine used by the HTTP layer
+
+    Tables are created and migrated through the sync engine, which is initialized first.
+    """
+    init()
+    engine = create_async_engine(settings.database.async_dsn(), pool_pre_ping=True, pool_size=10, max_overflow=20)
+    event.listen(engine.sync_engine, "before_cursor_execute", _count_query)
+    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+def get_async_session() -> AsyncSession:
+    session_maker = init_async()
+    return session_maker()
+
+
+def _migrate(engine):
+    """Add columns and indexes introduced after a table was created, since create_all only creates missing tables
+
+    New columns must be nullable or have a server default. Columns that have become nullable are altered to allow
+    NULL, except on SQLite, which can't alter columns.
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    LOG.info("Adding column %s to table %s", column.name, table.name)
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+                elif column.nullable and not existing_columns[column.name]["nullable"]:
+                    _drop_not_null(conn, table, column)
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    LOG.info("Creating index %s on table %s", index.name, table.name)
+                    index.create(conn)
+
+
+def upsert(db: Session | AsyncSession, table: Table, values, update: list[str]):
+    """An INSERT of one or more rows, updating the `update` columns of rows that already exist
+
+    Rows where the `update` columns are unchanged are left alone, where the database supports it.
+    With values None, the rows are passed when executing the statement, which executes it for many rows at once.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+    else:
+        stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+    if values is not None:
+        stmt = stmt.values(values)
+    if dialect == "mysql":
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update})
+    return stmt.on_conflict_do_update(
+        index_elements=table.primary_key.columns,
+        set_={name: stmt.excluded[name] for name in update},
+        where=or_(*(table.c[name].is_distinct_from(stmt.excluded[name]) for name in update)),
+    )
+
+
+def random_uuid(db: Session | AsyncSession):
+    """An SQL expression generating a random UUID per row, in the form the Uuid column type stores it"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return func.gen_random_uuid(type_=Uuid)
+    if dialect == "mysql":
+        return func.replace(func.uuid(), "-", "")
+    return func.lower(func.hex(func.randomblob(16)))
+
+
+def _drop_not_null(conn, table: Table, column):
+    preparer = conn.dialect.identifier_preparer
+    if conn.dialect.name == "postgresql":
+        ddl = f"ALTER COLUMN {preparer.format_column(column)} DROP NOT NULL"
+    elif conn.dialect.name == "mysql":
+        ddl = f"MODIFY COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"
+    else:
+        LOG.warning("Column %s in table %s should allow NULL, recreate the table to fix it", column.name, table.name)
+        return
+    LOG.info("Allowing NULL in column %s of table %s", column.name, table.name)
+    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} {ddl}"))
+
+
+def insert_missing(db: Session | AsyncSession, table: Table):
+    """An INSERT that skips rows whose primary key already exists"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        return mysql.insert(table).prefix_with("IGNORE")
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    return insert(table).on_conflict_do_nothing(index_elements=table.primary_key.columns)
+
+
+def notify(db: Session | AsyncSession, table: Table) -> Optional[Executable]:
+    """A statement waking up listeners on the channel named after table, when the transaction commits
+
+    None on databases without notifications, where listeners have to poll instead.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return select(func.pg_notify(literal(table.name, String), literal("")))
+
+
+@contextmanager
+def count_queries():
+    """Count the statements executed in this context, including any threads or tasks started from it"""
+    counter = QueryCounter()
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
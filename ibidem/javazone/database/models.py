@@ -2,7 +2,7 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, ForeignKey, Table, Text, Uuid, String, Enum, DateTime
+from sqlalchemy import Column, ForeignKey, Table, Text, Uuid, String, Enum, DateTime, Integer, Index, text
 from sqlalchemy.orm import relationship
 
 from ibidem.javazone.database import Base
@@ -23,6 +23,23 @@ class Session(Base):
     data = Column(Text, nullable=False)
     users = relationship("User", secondary=user_session, back_populates="sessions")
 
+    # Copied from data when the session is synced, so listings can be filtered and sorted in the database
+    title = Column(String(256), nullable=True, index=True)
+    start_time = Column(DateTime, nullable=True, index=True)
+    end_time = Column(DateTime, nullable=True, index=True)
+    room = Column(String(128), nullable=True, index=True)
+    format = Column(String(64), nullable=True, index=True)
+    language = Column(String(16), nullable=True, index=True)
+
+
+class SessionSnapshot(Base):
+    """An immutable version of a session, stored once and referenced by hash from the email queue"""
+
+    __tablename__ = "session_snapshots"
+
+    hash = Column(String(64), primary_key=True, nullable=False)
+    data = Column(Text, nullable=False)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -39,8 +56,22 @@ class Action(enum.StrEnum):
     CANCEL = enum.auto()
 
 
+PENDING = text("sent_at IS NULL AND failed_at IS NULL")
+
+
 class EmailQueue(Base):
     __tablename__ = "email_queue"
+    __table_args__ = (
+        # Matches the dequeue query. MySQL has no partial indexes, and uses the leading columns instead
+        Index(
+            "ix_email_queue_pending",
+            "sent_at",
+            "failed_at",
+            "scheduled_at",
+            postgresql_where=PENDING,
+            sqlite_where=PENDING,
+        ),
+    )
 
     id = Column(
         Uuid(as_uuid=True),
@@ -50,10 +81,34 @@ class EmailQueue(Base):
         default=uuid.uuid4,
     )
     user_email = Column(String(256), nullable=False)
-    data = Column(Text, nullable=False)
+    # Rows queued before session snapshots were introduced carry their own copy of the session
+    data = Column(Text, nullable=True)
+    session_hash = Column(String(64), nullable=True, index=True)
+    session_id = Column(Uuid(as_uuid=True), nullable=True, index=True)
     action = Column(Enum(Action), nullable=False)
     scheduled_at = Column(DateTime, nullable=False, default=datetime.now)
-    sent_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True, index=True)
+    # The worker currently sending this email, which no other worker may claim it before lease_until
+    claimed_by = Column(String(64), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    # Failed sends are retried from retry_at, until max attempts is reached and failed_at is set
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+    retry_at = Column(DateTime, nullable=True)
+    failed_at = Column(DateTime, nullable=True)
 
     def __repr__(self):
         return f"<EmailQueue {self.id} {self.user_email} {self.action} {self.scheduled_at} {self.sent_at}>"
+
+
+class SyncState(Base):
+    """What we know about the last version of an upstream document we synced from"""
+
+    __tablename__ = "sync_state"
+
+    source = Column(String(256), primary_key=True, nullable=False)
+    generation = Column(Integer, nullable=True)
+    etag = Column(String(256), nullable=True)
+    last_modified = Column(String(64), nullable=True)
+    digest = Column(String(64), nullable=True)
+    synced_at = Column(DateTime, nullable=True)
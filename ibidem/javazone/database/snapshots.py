@@ -0,0 +1,24 @@
+import uuid
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ibidem.javazone.database import insert_missing, models
+
+
+def store(db: Session | AsyncSession, session_ids: Iterable[uuid.UUID]):
+    """A statement storing the current version of each session as a snapshot, unless it is already stored"""
+    current = select(models.Session.hash, models.Session.data).where(models.Session.id.in_(list(session_ids)))
+    return insert_missing(db, models.SessionSnapshot.__table__).from_select(["hash", "data"], current)
+
+
+def orphans():
+    """A query for the hashes of unused snapshots
+
+    A snapshot is unused when no queued email refers to it, and it isn't the current version of any session.
+    """
+    queued = select(models.EmailQueue.id).where(models.EmailQueue.session_hash == models.SessionSnapshot.hash)
+    current = select(models.Session.id).where(models.Session.hash == models.SessionSnapshot.hash)
+    return select(models.SessionSnapshot.hash).where(~queued.exists(), ~current.exists())
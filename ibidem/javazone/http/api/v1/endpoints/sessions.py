@@ -1,33 +1,68 @@
 import uuid
-from typing import List
+from typing import List, Iterable, Iterator, Annotated, Optional
 
-from fastapi import APIRouter, Depends, BackgroundTasks, Response, Request
-from icalendar import Calendar
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Response, Request, status, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ibidem.javazone import sleepingpill
 from ibidem.javazone.database import models
-from ibidem.javazone.http import schemas
+from ibidem.javazone.http import schemas, www
 from ibidem.javazone.http.deps import get_db, get_current_user
-from ibidem.javazone.ics import create_calendar
-from ibidem.javazone.services import sessions
+from ibidem.javazone.ics import iter_calendar
+from ibidem.javazone.services import catalog, sessions
 
 router = APIRouter(
     responses={404: {"detail": "Not found"}},
 )
 
 
+SESSION_ADAPTER = TypeAdapter(schemas.Session)
+SESSION_FIELDS = {
+    **{name: name for name in schemas.Session.model_fields},
+    **{field.alias: name for name, field in schemas.Session.model_fields.items() if field.alias},
+}
+CHUNK_SIZE = 64 * 1024
+
+
 class CalendarResponse(Response):
     media_type = "text/calendar; method=PUBLISH"
 
 
+class StreamingCalendarResponse(StreamingResponse):
+    media_type = CalendarResponse.media_type
+
+
 @router.get(
     "",
     response_model=List[schemas.Session],
 )
-def get_sessions(db: Session = Depends(get_db)) -> list[schemas.Session]:
-    """List all sessions"""
-    return [schemas.Session.model_validate_json(s.data) for s in sessions.get_all(db)]
+async def get_sessions(
+    req: Request,
+    query: Annotated[schemas.SessionQuery, Query()],
+    db: AsyncSession = Depends(get_db),
+) -> Response:
+    """List sessions, optionally filtered, sorted, paginated and projected
+
+    When a page is limited and more sessions are available, the next page is linked in the `Link` header.
+    """
+    include = _projection(query.fields)
+    snapshot = await catalog.snapshot(db)
+    if _not_modified(req, snapshot.etag):
+        return _not_modified_response(snapshot.etag)
+    headers = _cache_headers(snapshot.etag)
+    ids = None
+    if query.listing_changed():
+        ids, next_cursor = await sessions.find(query, db)
+        if next_cursor:
+            headers["Link"] = f'<{req.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    if include is None:
+        records = snapshot.fragments("json", lambda session: SESSION_ADAPTER.dump_json(session, by_alias=True), ids)
+    else:
+        records = (
+            SESSION_ADAPTER.dump_json(entry.session, by_alias=True, include=include) for entry in snapshot.select(ids)
+        )
+    return StreamingResponse(_chunked(_json_array(records)), media_type="application/json", headers=headers)
 
 
 @router.get(
@@ -35,20 +70,33 @@ def get_sessions(db: Session = Depends(get_db)) -> list[schemas.Session]:
     response_model=None,
     response_class=CalendarResponse,
 )
-def get_sessions_ics(req: Request, db: Session = Depends(get_db)) -> Calendar:
+async def get_sessions_ics(req: Request, db: AsyncSession = Depends(get_db)) -> Response:
     """Return calendar with all sessions"""
-    cal = create_calendar("PUBLISH")
-    for session in (schemas.Session.from_db_session(s) for s in sessions.get_all(db)):
-        cal.add_component(session.event(url_for=lambda i: f"Join here: {req.url_for('join_session_web', id=i)}"))
-    return cal.to_ical()
+
+    def event(session: schemas.Session) -> bytes:
+        return session.event(url_for=lambda i: f"Join here: {www.public_url('join_session_web', id=i)}").to_ical()
+
+    snapshot = await catalog.snapshot(db)
+    if _not_modified(req, snapshot.etag):
+        return _not_modified_response(snapshot.etag)
+    events = snapshot.fragments("ics", event)
+    return StreamingCalendarResponse(_chunked(iter_calendar("PUBLISH", events)), headers=_cache_headers(snapshot.etag))
 
 
 @router.get(
     "/{id}",
     response_model=schemas.Session,
 )
-def get_session(id: uuid.UUID, db: Session = Depends(get_db)) -> schemas.Session:
-    return schemas.Session.from_db_session(sessions.get(id, db))
+async def get_session(
+    id: uuid.UUID,
+    fields: Annotated[Optional[str], Query(description=schemas.FIELDS_DESCRIPTION)] = None,
+    db: AsyncSession = Depends(get_db),
+) -> schemas.Session:
+    include = _projection(fields)
+    session = catalog.get(await sessions.get(id, db, with_users=False))
+    if include is None:
+        return session
+    return Response(SESSION_ADAPTER.dump_json(session, by_alias=True, include=include), media_type="application/json")
 
 
 @router.get(
@@ -56,12 +104,13 @@ def get_session(id: uuid.UUID, db: Session = Depends(get_db)) -> schemas.Session
     response_model=schemas.SessionWithUsers,
     response_model_exclude_unset=True,
 )
-def join_session(
+async def join_session(
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> schemas.SessionWithUsers:
-    return schemas.SessionWithUsers.from_db_session(sessions.join(id, user, db))
+    db_session = await sessions.join(id, user, db)
+    return schemas.SessionWithUsers.from_session(catalog.get(db_session), db_session.users)
 
 
 @router.get(
@@ -69,14 +118,63 @@ def join_session(
     response_model=schemas.SessionWithUsers,
     response_model_exclude_unset=True,
 )
-def leave_session(
+async def leave_session(
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> schemas.SessionWithUsers:
-    return schemas.SessionWithUsers.from_db_session(sessions.leave(id, user, db))
-
-
-@router.post("", name="Update sessions", status_code=204)
-def update_sessions(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    background_tasks.add_task(sleepingpill.update_sessions, db)
+    db_session = await sessions.leave(id, user, db)
+    return schemas.SessionWithUsers.from_session(catalog.get(db_session), db_session.users)
+
+
+def _projection(fields: Optional[str]) -> Optional[set[str]]:
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - SESSION_FIELDS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+    return {SESSION_FIELDS[field] for field in requested}
+
+
+def _not_modified(req: Request, etag: str) -> bool:
+    if_none_match = req.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
+
+def _cache_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _json_array(records: Iterable[bytes]) -> Iterator[bytes]:
+    yield b"["
+    for i, record in enumerate(records):
+        if i > 0:
+            yield b","
+        yield record
+    yield b"]"
+
+
+def _chunked(parts: Iterable[bytes]) -> Iterator[bytes]:
+    """Group small parts into chunks of about CHUNK_SIZE bytes, to avoid a write per part"""
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b"".join(chunk)
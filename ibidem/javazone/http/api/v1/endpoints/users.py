@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from ibidem.javazone.database import models
 from ibidem.javazone.http import schemas
 from ibidem.javazone.http.deps import get_db, get_current_user
 from ibidem.javazone.services import users
@@ -11,10 +12,10 @@ router = APIRouter(
 
 
 @router.get("/me", response_model=schemas.User)
-def get_me(user: schemas.User = Depends(get_current_user)):
-    return user
+async def get_me(user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await users.load_sessions(user, db)
 
 
 @router.delete("/me", name="Delete user", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user: schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    users.delete_user(user, db)
+async def delete_user(user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    await users.delete_user(user, db)
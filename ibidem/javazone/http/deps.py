@@ -2,18 +2,18 @@ import logging
 from pprint import pformat
 from typing import Annotated
 
-import jinja2
 from authlib.jose import JoseError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ibidem.javazone.core.config import settings
-from ibidem.javazone.database import get_session
+from ibidem.javazone.database import get_async_session
 from ibidem.javazone.http import schemas
 from ibidem.javazone.security import decode_token
 from ibidem.javazone.services import users
+from ibidem.javazone.templating import get_templates
 
 LOG = logging.getLogger(__name__)
 
@@ -21,29 +21,21 @@ LOG = logging.getLogger(__name__)
 token_auth_scheme = HTTPBearer()
 
 
-def get_db():
-    db = get_session()
-    try:
+async def get_db():
+    async with get_async_session() as db:
         yield db
-    finally:
-        db.close()
 
 
-def templates():
-    loader = jinja2.PackageLoader("ibidem.javazone")
-    env = jinja2.Environment(loader=loader, autoescape=True)
-    return Jinja2Templates(env=env)
+def templates() -> Jinja2Templates:
+    return get_templates()
 
 
 async def get_current_user(
     token: Annotated[HTTPAuthorizationCredentials, Depends(token_auth_scheme)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     user = await get_authenticated_user(token)
-    db_user = users.get_user(user, db)
-    if db_user is None:
-        db_user = users.create_user(user, db)
-    return db_user
+    return await users.resolve_user(user, db)
 
 
 async def get_authenticated_user(
@@ -3,7 +3,7 @@ import logging
 from fastapi import APIRouter, status, Depends, HTTPException
 from sqlalchemy import select
 from sqlalchemy.exc import OperationalError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ibidem.javazone.http.deps import get_db
 
@@ -15,9 +15,9 @@ router = APIRouter(
 
 
 @router.get("/healthy", status_code=status.HTTP_200_OK)
-def liveness(db: Session = Depends(get_db)):
+async def liveness(db: AsyncSession = Depends(get_db)):
     try:
-        db.execute(select(1))
+        await db.execute(select(1))
     except OperationalError as e:
         LOG.fatal("Database is not healthy: %s", e)
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)) from e
@@ -25,5 +25,5 @@ def liveness(db: Session = Depends(get_db)):
 
 
 @router.get("/ready", status_code=status.HTTP_200_OK)
-def readiness():
+async def readiness():
     return "Ready as an egg"
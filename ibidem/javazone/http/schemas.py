@@ -1,15 +1,19 @@
 import textwrap
 import zoneinfo
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Annotated
+from datetime import datetime, timedelta, date
+from enum import Enum
+from typing import List, Optional, Dict, Any, Annotated, Iterable
 from uuid import UUID
 
 from icalendar import Event, vUri, Alarm, vDuration
-from pydantic import BaseModel, ConfigDict, HttpUrl, AnyUrl, BeforeValidator
+from pydantic import BaseModel, ConfigDict, HttpUrl, AnyUrl, BeforeValidator, Field
 from pydantic.alias_generators import to_camel
 
 from ibidem.javazone.core.config import settings
 
+MAX_PAGE_SIZE = 500
+TIMEZONE = zoneinfo.ZoneInfo("Europe/Oslo")
+FIELDS_DESCRIPTION = "Comma separated list of fields to include, default is all fields"
 DEFAULT_URL_PATTERN = "https://{year}.javazone.no/program/{session_id}"
 JAVAZONE_URL_PATTERNS = {
     2025: "https://2025.javazone.no/en/program/{session_id}",
@@ -148,10 +152,10 @@ class Session(SessionId):
         if self.start_time:
             event.add(
                 "dtstart",
-                self.start_time.replace(tzinfo=zoneinfo.ZoneInfo("Europe/Oslo")),
+                self.start_time.replace(tzinfo=TIMEZONE),
             )
         if self.end_time:
-            event.add("dtend", self.end_time.replace(tzinfo=zoneinfo.ZoneInfo("Europe/Oslo")))
+            event.add("dtend", self.end_time.replace(tzinfo=TIMEZONE))
         if self.room:
             event.add("location", self.room)
 
@@ -185,12 +189,56 @@ class Session(SessionId):
 
 class SessionWithUsers(Session):
     users: List["AuthenticatedUser"] = []
+    attendee_count: int = 0
+    attendee_emails: frozenset[str] = Field(default=frozenset(), exclude=True)
+    hash: Optional[str] = Field(default=None, exclude=True)
 
     @classmethod
-    def from_db_session(cls, db_session):
-        session = cls.model_validate_json(db_session.data)
-        session.users = [AuthenticatedUser.model_validate(u) for u in db_session.users]
-        return session
+    def from_session(cls, session: Session, users, hash: Optional[str] = None):
+        users = [AuthenticatedUser.model_validate(u) for u in users]
+        return cls.model_construct(
+            _fields_set=session.model_fields_set | {"users", "attendee_count"},
+            **dict(session),
+            users=users,
+            attendee_count=len(users),
+            attendee_emails=frozenset(u.email for u in users),
+            hash=hash,
+        )
+
+    @classmethod
+    def from_attendees(cls, session: Session, emails: Iterable[str], hash: Optional[str] = None):
+        """A session that knows who attends it, without loading the attendees themselves"""
+        emails = frozenset(emails)
+        return cls.model_construct(
+            _fields_set=session.model_fields_set | {"attendee_count"},
+            **dict(session),
+            attendee_count=len(emails),
+            attendee_emails=emails,
+            hash=hash,
+        )
+
+
+class SessionSort(str, Enum):
+    START_TIME = "start_time"
+    TITLE = "title"
+    ROOM = "room"
+
+
+class SessionQuery(BaseModel):
+    day: Optional[date] = None
+    room: Optional[str] = None
+    format: Optional[str] = None
+    language: Optional[str] = None
+    starts_after: Optional[datetime] = None
+    starts_before: Optional[datetime] = None
+    sort: SessionSort = SessionSort.START_TIME
+    limit: Optional[int] = Field(default=None, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+    fields: Optional[str] = Field(default=None, description=FIELDS_DESCRIPTION)
+
+    def listing_changed(self) -> bool:
+        """True if the query selects or orders sessions differently from the full listing"""
+        return self.model_copy(update={"fields": None}) != SessionQuery()
 
 
 class SessionSlot(BaseModel):
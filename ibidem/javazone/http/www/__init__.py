@@ -4,13 +4,14 @@ import uuid
 from fastapi import APIRouter, Request, status, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from ibidem.javazone.core.config import settings
 from ibidem.javazone.database import models
 from ibidem.javazone.http import schemas
 from ibidem.javazone.http.deps import get_db, get_current_user, templates
 from ibidem.javazone.http.www.widgets import router as widgets_router
-from ibidem.javazone.services import sessions
+from ibidem.javazone.services import catalog, sessions
 
 LOG = logging.getLogger(__name__)
 
@@ -18,25 +19,32 @@ router = APIRouter()
 router.include_router(widgets_router, prefix="/widgets", tags=["widgets"])
 
 
+def public_url(name: str, **path_params) -> str:
+    """The URL of a page under `settings.base_url`, for links that don't depend on who requested them"""
+    return f"{settings.base_url.rstrip('/')}{router.url_path_for(name, **path_params)}"
+
+
 @router.get("/", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def index(request: Request, templates: Jinja2Templates = Depends(templates)):
+async def index(request: Request, templates: Jinja2Templates = Depends(templates)):
     return templates.TemplateResponse(request, "index.html.j2")
 
 
 @router.get("/sessions/{id}", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def session(
+async def session(
     request: Request,
     id: uuid.UUID,
     user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     templates: Jinja2Templates = Depends(templates),
 ):
-    session = sessions.get(id, db)
+    db_session = await sessions.get(id, db)
     return templates.TemplateResponse(
         request=request,
         name="session.html.j2",
         context={
-            "session": schemas.SessionWithUsers.from_db_session(session),
+            "session": schemas.SessionWithUsers.from_session(
+                catalog.get(db_session), db_session.users, db_session.hash
+            ),
             "user": user,
         },
     )
@@ -47,13 +55,13 @@ def session(
     status_code=status.HTTP_302_FOUND,
     response_class=RedirectResponse,
 )
-def join_session_web(
+async def join_session_web(
     request: Request,
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    sessions.join(id, user, db)
+    await sessions.join(id, user, db)
     return str(request.url_for("session", id=id))
 
 
@@ -62,13 +70,13 @@ def join_session_web(
     status_code=status.HTTP_302_FOUND,
     response_class=RedirectResponse,
 )
-def leave_session_web(
+async def leave_session_web(
     request: Request,
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    sessions.leave(id, user, db)
+    await sessions.leave(id, user, db)
     return str(request.url_for("session", id=id))
 
 
@@ -77,24 +85,29 @@ def leave_session_web(
     status_code=status.HTTP_302_FOUND,
     response_class=RedirectResponse,
 )
-def update_session_web(
+async def update_session_web(
     request: Request,
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    sessions.update(id, user, db)
+    await sessions.update(id, user, db)
     return str(request.url_for("session", id=id))
 
 
 @router.get("/sessions", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def all_sessions(
+async def all_sessions(
     request: Request,
     user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     templates: Jinja2Templates = Depends(templates),
 ):
-    all_sessions = [schemas.SessionWithUsers.from_db_session(s) for s in sessions.get_all(db)]
+    snapshot = await catalog.snapshot(db)
+    attendees = await sessions.get_attendee_emails(db)
+    all_sessions = [
+        schemas.SessionWithUsers.from_attendees(entry.session, attendees[entry.session.id], entry.hash)
+        for entry in snapshot.entries
+    ]
     return templates.TemplateResponse(
         request=request,
         name="sessions.html.j2",
@@ -106,16 +119,15 @@ def all_sessions(
 
 
 @router.get("/user/sessions", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def user_sessions(
+async def user_sessions(
     request: Request,
     user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     templates: Jinja2Templates = Depends(templates),
 ):
-    sess = [
-        schemas.SessionWithUsers.from_db_session(s)
-        for s in db.query(models.Session).filter(models.Session.users.any(email=user.email)).all()
-    ]
+    db_sessions = await sessions.get_for_user(user, db)
+    attendees = await sessions.get_attendee_emails(db, (s.id for s in db_sessions))
+    sess = [schemas.SessionWithUsers.from_attendees(catalog.get(s), attendees[s.id], s.hash) for s in db_sessions]
     return templates.TemplateResponse(
         request=request,
         name="sessions.html.j2",
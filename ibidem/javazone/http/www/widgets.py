@@ -3,88 +3,82 @@ import uuid
 from fastapi import APIRouter, Request, Depends, status
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ibidem.javazone.database import models
 from ibidem.javazone.http import schemas
 from ibidem.javazone.http.deps import get_db, get_current_user, templates
-from ibidem.javazone.services import sessions
+from ibidem.javazone.services import catalog, sessions
+from ibidem.javazone.templating import render_session_fragment
 
 router = APIRouter()
 
 
 @router.get("/{id}/update", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def update_session_widget(
+async def update_session_widget(
     request: Request,
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     templates: Jinja2Templates = Depends(templates),
 ):
-    session = sessions.update(id, user, db)
+    db_session = await sessions.update(id, user, db)
     return templates.TemplateResponse(
         request=request,
         name="widgets/session_join_leave.html.j2",
         context={
-            "session": session,
+            "session": schemas.SessionWithUsers.from_session(catalog.get(db_session), db_session.users),
             "user": user,
         },
     )
 
 
 @router.get("/{id}/join", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def join_session_widget(
+async def join_session_widget(
     request: Request,
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     templates: Jinja2Templates = Depends(templates),
 ):
-    session = sessions.join(id, user, db)
+    db_session = await sessions.join(id, user, db)
     return templates.TemplateResponse(
         request=request,
         name="widgets/session_join_leave.html.j2",
         context={
-            "session": session,
+            "session": schemas.SessionWithUsers.from_session(catalog.get(db_session), db_session.users),
             "user": user,
         },
     )
 
 
 @router.get("/{id}/leave", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def leave_session_widget(
+async def leave_session_widget(
     request: Request,
     id: uuid.UUID,
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     templates: Jinja2Templates = Depends(templates),
 ):
-    session = sessions.leave(id, user, db)
+    db_session = await sessions.leave(id, user, db)
     return templates.TemplateResponse(
         request=request,
         name="widgets/session_join_leave.html.j2",
         context={
-            "session": schemas.SessionWithUsers.from_db_session(session),
+            "session": schemas.SessionWithUsers.from_session(catalog.get(db_session), db_session.users),
             "user": user,
         },
     )
 
 
 @router.get("/{id}", status_code=status.HTTP_200_OK, response_class=HTMLResponse)
-def session_widget(
+async def session_widget(
     request: Request,
     id: uuid.UUID,
     size: str = "small",
     user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    templates: Jinja2Templates = Depends(templates),
+    db: AsyncSession = Depends(get_db),
 ):
-    session = sessions.get(id, db)
-    return templates.TemplateResponse(
-        request=request,
-        name=f"widgets/session_{size}.html.j2",
-        context={
-            "session": schemas.SessionWithUsers.from_db_session(session),
-            "user": user,
-        },
-    )
+    db_session = await sessions.get(id, db)
+    session = schemas.SessionWithUsers.from_session(catalog.get(db_session), db_session.users, db_session.hash)
+    return HTMLResponse(render_session_fragment(request, f"widgets/session_{size}.html.j2", session, user))
@@ -1,5 +1,9 @@
+from typing import Iterable, Iterator
+
 from icalendar import Calendar
 
+END_CALENDAR = b"END:VCALENDAR\r\n"
+
 
 def create_calendar(method):
     cal = Calendar()
@@ -7,3 +11,11 @@ def create_calendar(method):
     cal.add("version", "2.0")
     cal.add("method", method)
     return cal
+
+
+def iter_calendar(method, events: Iterable[bytes]) -> Iterator[bytes]:
+    """Wrap already serialized VEVENTs in a VCALENDAR envelope, without joining them"""
+    envelope = create_calendar(method).to_ical()
+    yield envelope.removesuffix(END_CALENDAR)
+    yield from events
+    yield END_CALENDAR
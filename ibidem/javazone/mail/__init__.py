@@ -1,44 +1,279 @@
+import itertools
 import logging
-from datetime import datetime
+import os
+import socket
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
 
-from fastapi import Request
 from icalendar import Calendar, vCalAddress, vText, vBoolean
-from sqlalchemy import select
+from sqlalchemy import and_, delete, func, or_, select, update
 from sqlalchemy.orm import Session
 
 from ibidem.javazone.core import config
 from ibidem.javazone.core.config import settings
-from ibidem.javazone.database import models
+from ibidem.javazone.core.lru import LRU
+from ibidem.javazone.database import models, snapshots
 from ibidem.javazone.database.models import EmailQueue
-from ibidem.javazone.http import schemas
+from ibidem.javazone.http import schemas, www
 from ibidem.javazone.ics import create_calendar
 from ibidem.javazone.mail import sendgrid
 from ibidem.javazone.mail import smtp
 
 LOG = logging.getLogger(__name__)
 
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"[:64]
+
+
+class SnapshotCache:
+    """Parsed session snapshots, kept in a bounded LRU since a snapshot never changes once stored"""
+
+    def __init__(self, size: int):
+        self._sessions: LRU[str, schemas.Session] = LRU(size)
+
+    def get(self, hash: str, db: Session) -> schemas.Session:
+        session = self._sessions.get(hash)
+        if session is not None:
+            return session
+        snapshot = db.get(models.SessionSnapshot, hash)
+        if snapshot is None:
+            raise LookupError(f"Session snapshot {hash} not found")
+        session = schemas.Session.model_validate_json(snapshot.data)
+        self._sessions.put(hash, session)
+        return session
+
+
+snapshot_cache = SnapshotCache(settings.cache.snapshot_size)
+
+
+def process_queue(db: Session) -> int:
+    """Send queued emails until the queue is empty, and return the number sent
+
+    Emails are taken in batches of `settings.mail.batch_size`, and up to `settings.mail.concurrency` of them are built
+    and sent at the same time, in a pool of threads. The database is only used from the calling thread. Each batch is
+    claimed before it is sent, so any number of workers can process the queue at once. Emails that fail are retried
+    later, see `_fail`.
+    """
 
-async def process_queue(req: Request, db: Session):
     def url_for(i):
-        return f"Leave here: {req.url_for('leave_session_web', id=i)}"
-
-    stmt = select(EmailQueue).where(EmailQueue.sent_at.is_(None)).order_by(EmailQueue.scheduled_at).limit(30)
-    for eq in db.scalars(stmt):
-        LOG.debug("Processing email queue item %r", eq)
-        session = schemas.Session.model_validate_json(eq.data)
-        match eq.action:
-            case models.Action.INVITE:
-                send_invite(eq, session, url_for)
-            case models.Action.CANCEL:
-                send_cancel(eq, session)
-            case models.Action.UPDATE:
-                send_update(eq, session, url_for)
-            case _:
-                LOG.error("Unknown action %r", eq.action)
-                continue
-        eq.sent_at = datetime.now()
-        db.add(eq)
-        db.commit()
+        return f"Leave here: {www.public_url('leave_session_web', id=i)}"
+
+    def submit(executor: ThreadPoolExecutor, eq: EmailQueue) -> Future:
+        try:
+            session = _load_session(eq, db)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        return executor.submit(_send, eq, session, url_for)
+
+    coalesce_queue(db)
+    failed = 0
+    sent = 0
+    with ThreadPoolExecutor(settings.mail.concurrency, thread_name_prefix="mail") as executor:
+        while True:
+            batch = claim(db, settings.mail.batch_size)
+            if not batch:
+                break
+            futures = [submit(executor, eq) for eq in batch]
+            wait(futures)
+            now = datetime.now()
+            for eq, future in zip(batch, futures):
+                result = future.exception() or future.result()
+                if result is True:
+                    _write_back(db, eq, now, sent_at=now)
+                    sent += 1
+                else:
+                    error = result if isinstance(result, BaseException) else None
+                    if error is not None:
+                        LOG.error("Failed to send email queue item %r: %s", eq, error, exc_info=error)
+                    _write_back(db, eq, now, **_fail(eq, error, now))
+                    failed += 1
+            db.commit()
+            if len(batch) < settings.mail.batch_size:
+                break
+    if sent or failed:
+        LOG.info("Sent %d emails, %d failed", sent, failed)
+    return sent
+
+
+def _write_back(db: Session, eq: EmailQueue, now: datetime, **values):
+    """Update an email this worker has claimed, unless the lease ran out and another worker may have claimed it since"""
+    stmt = (
+        update(EmailQueue)
+        .where(EmailQueue.id == eq.id, EmailQueue.claimed_by == WORKER_ID, EmailQueue.lease_until >= now)
+        .values(values)
+    )
+    if db.execute(stmt, execution_options={"synchronize_session": False}).rowcount == 0:
+        LOG.warning("Lost the lease on email queue item %r, leaving it to the worker that holds it now", eq)
+
+
+def _fail(eq: EmailQueue, error: Optional[BaseException], now: datetime) -> dict:
+    """Values that release a failed email for a retry with exponential backoff, or give up on it after too many attempts
+
+    Emails that are given up on stay in the queue with failed_at set, and are not picked up again.
+    """
+    attempts = eq.attempts + 1
+    values = {
+        "claimed_by": None,
+        "lease_until": None,
+        "attempts": attempts,
+        "last_error": str(error) if error is not None else "Not sent",
+    }
+    if attempts >= settings.mail.max_attempts:
+        LOG.warning("Giving up on email queue item %r after %d attempts", eq, attempts)
+        values["failed_at"] = now
+    else:
+        values["retry_at"] = now + timedelta(seconds=settings.mail.retry_delay * 2 ** (attempts - 1))
+    return values
+
+
+def claim(db: Session, limit: int) -> list[EmailQueue]:
+    """Lease up to limit pending emails to this worker, oldest first
+
+    On PostgreSQL and MySQL, rows another worker is claiming at the same moment are skipped rather than waited for.
+    SQLite serializes writes, so there the claim is a single conditional update.
+    Emails whose lease has expired, because the worker holding them died, are claimed like any other pending email.
+    Emails waiting to be retried are not claimed until their retry_at.
+    """
+    now = datetime.now()
+    available = and_(_unclaimed(now), or_(EmailQueue.retry_at.is_(None), EmailQueue.retry_at <= now))
+    candidates = select(EmailQueue.id).where(available).order_by(EmailQueue.scheduled_at).limit(limit)
+    values = {"claimed_by": WORKER_ID, "lease_until": now + timedelta(seconds=settings.mail.lease_time)}
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = update(EmailQueue).where(EmailQueue.id.in_(candidates), available).values(values)
+        ids = db.scalars(stmt.returning(EmailQueue.id), execution_options={"synchronize_session": False}).all()
+    else:
+        ids = db.scalars(candidates.with_for_update(skip_locked=True)).all()
+        if ids:
+            stmt = update(EmailQueue).where(EmailQueue.id.in_(ids)).values(values)
+            db.execute(stmt, execution_options={"synchronize_session": False})
+    db.commit()
+    if not ids:
+        return []
+    return list(db.scalars(select(EmailQueue).where(EmailQueue.id.in_(ids)).order_by(EmailQueue.scheduled_at)))
+
+
+def _unclaimed(now: datetime):
+    return and_(
+        EmailQueue.sent_at.is_(None),
+        EmailQueue.failed_at.is_(None),
+        or_(EmailQueue.lease_until.is_(None), EmailQueue.lease_until < now),
+    )
+
+
+def _send(eq: EmailQueue, session: schemas.Session, url_for) -> bool:
+    LOG.debug("Processing email queue item %r", eq)
+    match eq.action:
+        case models.Action.INVITE:
+            send_invite(eq, session, url_for)
+        case models.Action.CANCEL:
+            send_cancel(eq, session)
+        case models.Action.UPDATE:
+            send_update(eq, session, url_for)
+        case _:
+            LOG.error("Unknown action %r", eq.action)
+            return False
+    return True
+
+
+def purge_queue(db: Session) -> int:
+    """Delete emails sent more than `settings.mail.retention_days` ago, and the snapshots nothing refers to anymore
+
+    Rows are deleted in batches of `settings.mail.purge_batch_size`, each in its own transaction, so workers
+    processing the queue are never held up for long. Emails that were given up on are kept. Returns the number of
+    emails deleted.
+    """
+    cutoff = datetime.now() - timedelta(days=settings.mail.retention_days)
+    emails = _delete_in_batches(db, EmailQueue.id, select(EmailQueue.id).where(EmailQueue.sent_at < cutoff))
+    orphans = _delete_in_batches(db, models.SessionSnapshot.hash, snapshots.orphans())
+    if emails or orphans:
+        LOG.info("Purged %d sent emails and %d session snapshots", emails, orphans)
+    return emails
+
+
+def _delete_in_batches(db: Session, key, query) -> int:
+    deleted = 0
+    while True:
+        keys = db.scalars(query.limit(settings.mail.purge_batch_size)).all()
+        if keys:
+            db.execute(delete(key.class_).where(key.in_(keys)), execution_options={"synchronize_session": False})
+            db.commit()
+            deleted += len(keys)
+        if len(keys) < settings.mail.purge_batch_size:
+            return deleted
+
+
+def coalesce_queue(db: Session) -> int:
+    """Collapse the pending emails for each user and session into the one that has the final effect
+
+    The superseded emails are marked as sent without being sent. Emails claimed by a worker or given up on are left
+    alone, while emails waiting to be retried are included. Each user and session is coalesced in a transaction of its
+    own, which is rolled back if a worker claimed any of its emails after they were read. Returns the number of sends
+    saved.
+    """
+    now = datetime.now()
+    pending = and_(_unclaimed(now), EmailQueue.session_id.is_not(None))
+    pairs = (
+        select(EmailQueue.user_email, EmailQueue.session_id)
+        .where(pending)
+        .group_by(EmailQueue.user_email, EmailQueue.session_id)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    stmt = (
+        select(EmailQueue.id, EmailQueue.user_email, EmailQueue.session_id, EmailQueue.action)
+        .join(pairs, and_(EmailQueue.user_email == pairs.c.user_email, EmailQueue.session_id == pairs.c.session_id))
+        .where(pending)
+        .order_by(EmailQueue.user_email, EmailQueue.session_id, EmailQueue.scheduled_at)
+    )
+    groups = [list(group) for _, group in itertools.groupby(db.execute(stmt), key=lambda row: row[1:3])]
+    db.commit()
+    saved = 0
+    for group in groups:
+        action = coalesce([row.action for row in group])
+        keep = group[-1].id if action is not None else None
+        superseded = [row.id for row in group if row.id != keep]
+        if _supersede(db, superseded, keep, action, now):
+            saved += len(superseded)
+    if saved:
+        LOG.info("Coalesced pending emails, saved %d sends", saved)
+    return saved
+
+
+def _supersede(db: Session, ids: list, keep, action: Optional[models.Action], now: datetime) -> bool:
+    """Mark ids as sent and give keep the coalesced action, unless a worker has claimed any of them in the meantime"""
+    options = {"synchronize_session": False}
+    stmt = update(EmailQueue).where(EmailQueue.id.in_(ids), _unclaimed(now)).values(sent_at=now)
+    expected, updated = len(ids), db.execute(stmt, execution_options=options).rowcount
+    if keep is not None and updated == expected:
+        stmt = update(EmailQueue).where(EmailQueue.id == keep, _unclaimed(now)).values(action=action)
+        expected, updated = expected + 1, updated + db.execute(stmt, execution_options=options).rowcount
+    if updated != expected:
+        db.rollback()
+        LOG.info("Emails for %s were claimed while coalescing, leaving them as they are", ids)
+        return False
+    db.commit()
+    return True
+
+
+def coalesce(actions: Sequence[models.Action]) -> Optional[models.Action]:
+    """The single action with the same effect as actions in order, or None if they cancel out
+
+    The first action tells whether the user had the event before, the last whether they should have it after.
+    """
+    first, last = actions[0], actions[-1]
+    if first == models.Action.INVITE:
+        if last == models.Action.CANCEL:
+            return None
+        return models.Action.INVITE
+    return last
+
+
+def _load_session(eq: EmailQueue, db: Session) -> schemas.Session:
+    if eq.session_hash is None:
+        return schemas.Session.model_validate_json(eq.data)
+    return snapshot_cache.get(eq.session_hash, db)
 
 
 def send_update(eq, session, url_for):
@@ -53,16 +288,22 @@ def send_cancel(eq: EmailQueue, session: schemas.Session):
 
 
 def send_invite(eq: EmailQueue, session: schemas.Session, url_for):
+    if not _can_invite(session):
+        return
+    LOG.info("Sending invite to %s for session %s", eq.user_email, session.id)
+    invite = _create_invite(session, eq.user_email, url_for)
+    _send_message(eq, session.title, invite)
+
+
+def _can_invite(session: schemas.Session) -> bool:
     if any(v is None for v in (session.start_time, session.end_time)):
         LOG.warning(
             "Can't send invite for Session %s (%s), it is missing required fields",
             session.id,
             session.title,
         )
-        return
-    LOG.info("Sending invite to %s for session %s", eq.user_email, session.id)
-    invite = _create_invite(session, eq.user_email, url_for)
-    _send_message(eq, session.title, invite)
+        return False
+    return True
 
 
 def _send_message(eq: EmailQueue, title: str, invite: Calendar):
@@ -1,15 +1,18 @@
 import base64
+import functools
 import logging
-import urllib.error
 
+import httpx
 from icalendar import Calendar
-from sendgrid import Mail, Attachment, SendGridAPIClient
+from sendgrid import Mail, Attachment
 
 from ibidem.javazone.core.config import settings
 from ibidem.javazone.database.models import EmailQueue
 
 LOG = logging.getLogger(__name__)
 
+SEND_PATH = "/v3/mail/send"
+
 
 class SendGridException(Exception):
     pass
@@ -19,6 +22,16 @@ def enabled():
     return settings.mail.sendgrid.api_key is not None and settings.mail.sender_email is not None
 
 
+@functools.cache
+def client() -> httpx.Client:
+    """A client shared by all sends, so connections to SendGrid are kept alive between them"""
+    return httpx.Client(
+        base_url=settings.mail.sendgrid.host,
+        headers={"Authorization": f"Bearer {settings.mail.sendgrid.api_key.get_secret_value()}"},
+        timeout=settings.mail.sendgrid.timeout,
+    )
+
+
 def send_message(eq: EmailQueue, title: str, invite: Calendar):
     message = Mail(
         from_email=settings.mail.sender_email,
@@ -38,10 +51,9 @@ def send_message(eq: EmailQueue, title: str, invite: Calendar):
         LOG.info("Send is disabled! Would have sent email %s", message)
         LOG.debug("iCalendar:\n%s", bytes.decode("utf-8"))
         return
-    sg = SendGridAPIClient(settings.mail.sendgrid.api_key.get_secret_value())
     try:
-        response = sg.send(message)
-    except urllib.error.HTTPError as e:
+        response = client().post(SEND_PATH, json=message.get())
+    except httpx.HTTPError as e:
         raise SendGridException(f"HTTP error occurred: {e}") from e
     if response.status_code < 200 or response.status_code >= 300:
-        raise SendGridException(f"Failed to send email: {response.status_code} {response.body}")
+        raise SendGridException(f"Failed to send email: {response.status_code} {response.text}")
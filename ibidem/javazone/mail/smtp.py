@@ -1,5 +1,7 @@
 import logging
 import smtplib
+import ssl
+import threading
 from email import utils, headerregistry
 from email.message import EmailMessage, MIMEPart
 
@@ -8,6 +10,102 @@ from ibidem.javazone.core.config import settings
 LOG = logging.getLogger(__name__)
 
 
+class Connection:
+    """An SMTP connection, logged in if credentials are configured
+
+    Without SSL, the connection is upgraded with STARTTLS when the server supports it, before logging in.
+    """
+
+    def __init__(self):
+        smtp_settings = settings.mail.smtp
+        if smtp_settings.ssl:
+            self.smtp = smtplib.SMTP_SSL(
+                smtp_settings.host,
+                smtp_settings.port,
+                timeout=smtp_settings.timeout,
+                context=ssl.create_default_context(),
+            )
+        else:
+            self.smtp = smtplib.SMTP(smtp_settings.host, smtp_settings.port, timeout=smtp_settings.timeout)
+        self.smtp.set_debuglevel(2 if settings.debug else 0)
+        try:
+            if not smtp_settings.ssl:
+                self.smtp.ehlo()
+                if self.smtp.has_extn("starttls"):
+                    self.smtp.starttls(context=ssl.create_default_context())
+                    self.smtp.ehlo()
+            if smtp_settings.username:
+                self.smtp.login(smtp_settings.username, smtp_settings.password.get_secret_value())
+        except BaseException:
+            self.close()
+            raise
+        self.sent = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class ConnectionPool:
+    """SMTP connections reused across messages, so each message only costs the mail transaction itself
+
+    Connections are retired after `settings.mail.smtp.max_messages_per_connection` messages, since servers limit how
+    many messages they accept per connection. A reused connection the server has dropped is replaced, and the
+    message sent again on the new connection.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._lock = threading.Lock()
+        self._idle: list[Connection] = []
+
+    def send(self, msg: EmailMessage):
+        conn = self._take()
+        try:
+            conn.smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            conn.close()
+            if conn.sent == 0:
+                raise
+            LOG.info("SMTP connection was dropped by the server, reconnecting")
+            conn = Connection()
+            try:
+                conn.smtp.send_message(msg)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+        conn.sent += 1
+        self._give(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _take(self) -> Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return Connection()
+
+    def _give(self, conn: Connection):
+        if conn.sent < settings.mail.smtp.max_messages_per_connection:
+            with self._lock:
+                if len(self._idle) < self._size:
+                    self._idle.append(conn)
+                    return
+        conn.close()
+
+
+pool = ConnectionPool(settings.mail.concurrency)
+
+
 def enabled():
     return (
         settings.mail.smtp.username is not None
@@ -46,11 +144,5 @@ def send_message(eq, title, invite):
         LOG.info("Send is disabled! Would have sent email\n\n%s", msg)
         return
 
-    smtp = smtplib.SMTP_SSL(settings.mail.smtp.host)
-    try:
-        smtp.set_debuglevel(2 if settings.debug else 0)
-        smtp.login(settings.mail.smtp.username, settings.mail.smtp.password.get_secret_value())
-        smtp.send_message(msg)
-        LOG.info("Email sent successfully")
-    finally:
-        smtp.quit()
+    pool.send(msg)
+    LOG.info("Email sent successfully")
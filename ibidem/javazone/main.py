@@ -1,17 +1,26 @@
 #!/usr/bin/env python
+import argparse
+import asyncio
 import logging
+import logging.config
 import signal
 from contextlib import asynccontextmanager
 
 import sys
 import uvicorn
 from fastapi import FastAPI
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from ibidem.javazone.core.config import settings
 from ibidem.javazone.core.logging import get_log_config
-from ibidem.javazone.database import init as init_db
+from ibidem.javazone import worker
+from ibidem.javazone.database import init_async as init_db, count_queries, models
 from ibidem.javazone.http import include_routers
+from ibidem.javazone.mail import smtp
 from ibidem.javazone.security import init_jwt
+from ibidem.javazone.services import catalog
+from ibidem.javazone.templating import warm_up as warm_up_templates
 
 LOG = logging.getLogger(__name__)
 TITLE = "JavaZone calendar manager"
@@ -25,21 +34,78 @@ class ExitOnSignal(Exception):
 async def lifespan(app: FastAPI):
     init_db()
     init_jwt()
+    warm_up_templates()
+    wakeup = worker.Wakeup(models.Session.__table__)
+    listener = asyncio.create_task(_invalidate_catalog(wakeup)) if wakeup.enabled else None
     yield
+    if listener is not None:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+    await wakeup.close()
+    smtp.pool.close()
+
+
+async def _invalidate_catalog(wakeup: worker.Wakeup):
+    """Reload the session catalog as soon as the worker has synced sessions, instead of when it is next stale"""
+    while True:
+        if await wakeup.wait(settings.cache.catalog_max_age):
+            catalog.invalidate()
 
 
 app = FastAPI(title=TITLE, lifespan=lifespan)
 include_routers(app)
 
 
+class QueryCountMiddleware:
+    """Report the number of database queries made by each request in the X-Query-Count header
+
+    Only installed in debug mode, to spot endpoints whose queries grow with the program.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+
+            async def send_with_count(message: Message):
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append("X-Query-Count", str(counter.count))
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+        LOG.debug("%s %s executed %d queries", scope["method"], scope["path"], counter.count)
+
+
+if settings.debug:
+    app.add_middleware(QueryCountMiddleware)
+
+
 def main():
+    parser = argparse.ArgumentParser(prog="ibidem.javazone", description=TITLE)
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=("web", "worker"),
+        default="web",
+        help="Serve the web app, or run the worker processing the email queue and syncing sessions",
+    )
+    options = parser.parse_args()
     log_level = logging.DEBUG if settings.debug else logging.INFO
     log_format = "plain"
     exit_code = 0
     for sig in (signal.SIGTERM, signal.SIGINT):
         signal.signal(sig, signal_handler)
     try:
-        print(f"Starting {TITLE} with configuration {settings}")
+        print(f"Starting {TITLE} {options.command} with configuration {settings}")
+        if options.command == "worker":
+            logging.config.dictConfig(get_log_config(log_format, log_level))
+            asyncio.run(worker.run())
+            return exit_code
         uvicorn.run(
             "ibidem.javazone.main:app",
             host=settings.bind_address,
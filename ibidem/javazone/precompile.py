@@ -0,0 +1,24 @@
+"""Precompile the templates to python modules, for `settings.templates.precompiled_dir`
+
+Kept apart from the templating module so it runs without the app settings, such as during the image build.
+"""
+
+import logging
+import sys
+
+import jinja2
+
+LOG = logging.getLogger(__name__)
+
+PACKAGE = "ibidem.javazone"
+
+
+def compile_templates(target: str):
+    """Compile all templates to python modules in target"""
+    env = jinja2.Environment(loader=jinja2.PackageLoader(PACKAGE), autoescape=True)
+    env.compile_templates(target, zip=None, log_function=LOG.info, ignore_errors=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    compile_templates(sys.argv[1])
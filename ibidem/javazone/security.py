@@ -1,17 +1,80 @@
+import asyncio
 import logging
+import time
+from hashlib import sha256
+from typing import Optional
 
+import httpx
 from authlib.integrations.starlette_client import OAuth
-from authlib.jose import JsonWebToken
+from authlib.jose import JsonWebToken, JsonWebKey, KeySet
+from authlib.jose.errors import DecodeError
 
 from ibidem.javazone.core.config import settings
+from ibidem.javazone.core.lru import LRU
 
 SUPPORTED_ALGS_KEY = "id_token_signing_alg_values_supported"
 GOOGLE_WELL_KNOWN = "https://accounts.google.com/.well-known/openid-configuration"
+MIN_FORCED_REFRESH_INTERVAL = 60
 LOG = logging.getLogger(__name__)
 
 oauth = OAuth()
 
 
+class KeyCache:
+    """OIDC metadata and signing keys
+
+    Reloaded when older than `settings.cache.jwks_max_age`, or when a token is signed with a key we don't know,
+    which is what happens when the provider rotates its keys.
+    """
+
+    def __init__(self, metadata_url: str):
+        self._metadata_url = metadata_url
+        self._lock = asyncio.Lock()
+        self._jwt: Optional[JsonWebToken] = None
+        self._key_set: Optional[KeySet] = None
+        self._loaded_at = 0.0
+
+    async def get(self, force=False) -> tuple[JsonWebToken, KeySet]:
+        async with self._lock:
+            age = time.monotonic() - self._loaded_at
+            if (
+                self._key_set is None
+                or age > settings.cache.jwks_max_age
+                or (force and age > MIN_FORCED_REFRESH_INTERVAL)
+            ):
+                await self._load()
+            return self._jwt, self._key_set
+
+    async def _load(self):
+        async with httpx.AsyncClient() as client:
+            metadata = await _get_json(client, self._metadata_url)
+            jwk_set = await _get_json(client, metadata["jwks_uri"])
+        LOG.debug("Loaded signing keys, using these supported algorithms: %r", metadata[SUPPORTED_ALGS_KEY])
+        self._jwt = JsonWebToken(metadata[SUPPORTED_ALGS_KEY])
+        self._key_set = JsonWebKey.import_key_set(jwk_set)
+        self._loaded_at = time.monotonic()
+
+
+class ClaimsCache:
+    """A bounded LRU of verified claims, keyed by token digest, each kept until the token expires"""
+
+    def __init__(self, size: int):
+        self._claims: LRU[bytes, dict] = LRU(size, clock=time.time)
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        return self._claims.get(digest)
+
+    def put(self, digest: bytes, claims: dict):
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)) or expires_at <= time.time():
+            return
+        self._claims.put(digest, claims, expires_at)
+
+
+key_cache = KeyCache(GOOGLE_WELL_KNOWN)
+claims_cache = ClaimsCache(settings.cache.token_size)
+
+
 def init_jwt():
     if settings.debug:
         LOG.warning("Running in debug mode, using dummy login")
@@ -25,15 +88,25 @@ def init_jwt():
 
 
 async def decode_token(token):
-    client = oauth.create_client("google")
-    metadata = await client.load_server_metadata()
-    jwt = JsonWebToken(metadata[SUPPORTED_ALGS_KEY])
-    jwk_set = await client.fetch_jwk_set()
-    LOG.debug(
-        "Decoding a token, using these supported algorithms: %r",
-        metadata[SUPPORTED_ALGS_KEY],
-    )
-    return jwt.decode(
-        token,
-        jwk_set,
-    )
+    digest = sha256(token.encode("utf-8")).digest()
+    claims = claims_cache.get(digest)
+    if claims is not None:
+        return claims
+    jwt, key_set = await key_cache.get()
+    try:
+        claims = jwt.decode(token, key_set)
+    except ValueError:
+        LOG.info("Token signed with an unknown key, reloading signing keys")
+        jwt, key_set = await key_cache.get(force=True)
+        try:
+            claims = jwt.decode(token, key_set)
+        except ValueError as e:
+            raise DecodeError("Token signed with an unknown key") from e
+    claims_cache.put(digest, claims)
+    return claims
+
+
+async def _get_json(client: httpx.AsyncClient, url: str) -> dict:
+    resp = await client.get(url)
+    resp.raise_for_status()
+    return resp.json()
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from hashlib import sha256
+from typing import Optional, Callable, Hashable, Iterator, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.database import models
+from ibidem.javazone.http import schemas
+from ibidem.javazone.services import sessions
+
+LOG = logging.getLogger(__name__)
+
+LOAD_BATCH_SIZE = 100
+
+
+@dataclass(frozen=True)
+class Entry:
+    hash: str
+    session: schemas.Session
+    _fragments: dict[Hashable, bytes] = field(default_factory=dict, compare=False, repr=False)
+
+    def fragment(self, key: Hashable, build: Callable[[schemas.Session], bytes]) -> bytes:
+        """A serialized form of a single session, keyed by format, reused for as long as the session is unchanged"""
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            fragment = self._fragments[key] = build(self.session)
+        return fragment
+
+
+class Snapshot:
+    """An immutable view of the catalog, with a strong ETag"""
+
+    def __init__(self, entries: tuple[Entry, ...]):
+        self.entries = entries
+        self._by_id = {entry.session.id: entry for entry in entries}
+        digest = sha256(f"gen{settings.update_generation}".encode("utf-8"))
+        for entry in sorted(entries, key=lambda e: e.session.id):
+            digest.update(f"{entry.session.id}:{entry.hash}".encode("utf-8"))
+        self.etag = f'"{digest.hexdigest()}"'
+
+    @property
+    def sessions(self) -> list[schemas.Session]:
+        return [entry.session for entry in self.entries]
+
+    def select(self, ids: Optional[Iterable[uuid.UUID]] = None) -> Iterable[Entry]:
+        """Either all entries, or those in ids that are part of this snapshot"""
+        if ids is None:
+            return self.entries
+        return (self._by_id[id] for id in ids if id in self._by_id)
+
+    def fragments(
+        self, key: Hashable, build: Callable[[schemas.Session], bytes], ids: Optional[Iterable[uuid.UUID]] = None
+    ) -> Iterator[bytes]:
+        for entry in self.select(ids):
+            yield entry.fragment(key, build)
+
+
+class Catalog:
+    """Parsed sessions, keyed by session id and hash
+
+    A session is only parsed when its hash differs from the one we parsed last time.
+    The full listing is reloaded when invalidated, or when it is older than `settings.cache.catalog_max_age`,
+    so changes made by other replicas are picked up eventually. On PostgreSQL, web processes are invalidated as soon
+    as the worker has synced sessions.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._entries: dict[uuid.UUID, Entry] = {}
+        self._snapshot = Snapshot(())
+        self._loaded_at: Optional[float] = None
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    async def snapshot(self, db: AsyncSession) -> Snapshot:
+        if not self._stale():
+            return self._snapshot
+        async with self._lock:
+            if self._stale():
+                await self._load(db)
+            return self._snapshot
+
+    def get(self, db_session: models.Session) -> schemas.Session:
+        return self._parse(db_session.id, db_session.hash, db_session.data).session
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > settings.cache.catalog_max_age
+
+    async def _load(self, db: AsyncSession):
+        stmt = select(models.Session.id, models.Session.hash).order_by(
+            *sessions.ORDER_BY[schemas.SessionSort.START_TIME]
+        )
+        hashes = {row.id: row.hash for row in await db.execute(stmt)}
+        changed = [id for id, hash in hashes.items() if id not in self._entries or self._entries[id].hash != hash]
+        if changed:
+            stmt = (
+                select(models.Session.id, models.Session.hash, models.Session.data)
+                .where(models.Session.id.in_(changed))
+                .execution_options(yield_per=LOAD_BATCH_SIZE)
+            )
+            async for row in await db.stream(stmt):
+                self._parse(row.id, row.hash, row.data)
+        for id in self._entries.keys() - hashes.keys():
+            del self._entries[id]
+        snapshot = Snapshot(tuple(self._entries[id] for id in hashes if id in self._entries))
+        if snapshot.etag != self._snapshot.etag:
+            self._snapshot = snapshot
+        self._loaded_at = time.monotonic()
+        LOG.debug("Loaded session catalog, parsed %d of %d sessions", len(changed), len(hashes))
+
+    def _parse(self, id: uuid.UUID, hash: str, data: str) -> Entry:
+        entry = self._entries.get(id)
+        if entry is None or entry.hash != hash:
+            entry = Entry(hash, schemas.Session.model_validate_json(data))
+            self._entries[id] = entry
+        return entry
+
+
+_catalog = Catalog()
+
+
+async def snapshot(db: AsyncSession) -> Snapshot:
+    return await _catalog.snapshot(db)
+
+
+def get(db_session: models.Session) -> schemas.Session:
+    return _catalog.get(db_session)
+
+
+def invalidate():
+    _catalog.invalidate()
@@ -1,59 +1,173 @@
+import base64
+import binascii
+import json
 import uuid
-from typing import Optional
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from typing import Optional, Iterable
 
-from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from ibidem.javazone.database import models
+from ibidem.javazone.database import models, notify, snapshots
+from ibidem.javazone.http import schemas
 
+ORDER_BY = {
+    schemas.SessionSort.START_TIME: (
+        models.Session.start_time.is_(None),
+        models.Session.start_time,
+        models.Session.id,
+    ),
+    schemas.SessionSort.TITLE: (models.Session.title, models.Session.id),
+    schemas.SessionSort.ROOM: (
+        models.Session.room.is_(None),
+        models.Session.room,
+        models.Session.start_time.is_(None),
+        models.Session.start_time,
+        models.Session.id,
+    ),
+}
 
-def get_all(db: Session) -> list[models.Session]:
-    return db.query(models.Session).all()
 
+async def get_all(db: AsyncSession) -> list[models.Session]:
+    return list(await db.scalars(select(models.Session)))
 
-def get(id: uuid.UUID, db: Session) -> models.Session:
-    db_session: Optional[models.Session] = db.query(models.Session).filter(models.Session.id == id).first()
+
+async def find(query: schemas.SessionQuery, db: AsyncSession) -> tuple[list[uuid.UUID], Optional[str]]:
+    """Ids of the sessions matching query, in the requested order, and the cursor of the next page if any
+
+    Pages are keyset paginated on (start_time, id), with sessions without a start time last.
+    """
+    if query.sort != schemas.SessionSort.START_TIME and (query.limit is not None or query.cursor is not None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Pagination is only supported when sorting by start time"
+        )
+    stmt = select(models.Session.id, models.Session.start_time)
+    if query.day is not None:
+        start_of_day = datetime.combine(query.day, time.min)
+        stmt = stmt.where(
+            models.Session.start_time >= start_of_day,
+            models.Session.start_time < start_of_day + timedelta(days=1),
+        )
+    if query.starts_after is not None:
+        stmt = stmt.where(models.Session.start_time >= _local_time(query.starts_after))
+    if query.starts_before is not None:
+        stmt = stmt.where(models.Session.start_time < _local_time(query.starts_before))
+    if query.room is not None:
+        stmt = stmt.where(models.Session.room == query.room)
+    if query.format is not None:
+        stmt = stmt.where(models.Session.format == query.format)
+    if query.language is not None:
+        stmt = stmt.where(models.Session.language == query.language)
+    if query.cursor is not None:
+        start_time, id = _decode_cursor(query.cursor)
+        if start_time is None:
+            stmt = stmt.where(models.Session.start_time.is_(None), models.Session.id > id)
+        else:
+            stmt = stmt.where(
+                or_(
+                    models.Session.start_time > start_time,
+                    and_(models.Session.start_time == start_time, models.Session.id > id),
+                    models.Session.start_time.is_(None),
+                )
+            )
+    stmt = stmt.order_by(*ORDER_BY[query.sort])
+    if query.limit is not None:
+        stmt = stmt.limit(query.limit + 1)
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if query.limit is not None and len(rows) > query.limit:
+        rows = rows[: query.limit]
+        next_cursor = _encode_cursor(rows[-1].start_time, rows[-1].id)
+    return [row.id for row in rows], next_cursor
+
+
+def _local_time(value: datetime) -> datetime:
+    """value as a naive time in the conference time zone, which is how start times are stored"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(schemas.TIMEZONE).replace(tzinfo=None)
+
+
+def _encode_cursor(start_time: Optional[datetime], id: uuid.UUID) -> str:
+    value = json.dumps([start_time.isoformat() if start_time else None, str(id)])
+    return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[Optional[datetime], uuid.UUID]:
+    try:
+        start_time, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (datetime.fromisoformat(start_time) if start_time else None), uuid.UUID(id)
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from e
+
+
+async def get_for_user(user: models.User, db: AsyncSession) -> list[models.Session]:
+    return list(await db.scalars(select(models.Session).where(models.Session.users.any(email=user.email))))
+
+
+async def get_attendee_emails(
+    db: AsyncSession, session_ids: Optional[Iterable[uuid.UUID]] = None
+) -> defaultdict[uuid.UUID, set[str]]:
+    """The emails of the attendees of many sessions, in a single query on the membership table"""
+    stmt = select(models.user_session.c.session_id, models.user_session.c.user_email)
+    if session_ids is not None:
+        stmt = stmt.where(models.user_session.c.session_id.in_(list(session_ids)))
+    attendees = defaultdict(set)
+    for session_id, email in await db.execute(stmt):
+        attendees[session_id].add(email)
+    return attendees
+
+
+async def get(id: uuid.UUID, db: AsyncSession, with_users: bool = True) -> models.Session:
+    """A single session, with its attendees loaded unless with_users is False"""
+    stmt = select(models.Session).where(models.Session.id == id)
+    if with_users:
+        stmt = stmt.options(selectinload(models.Session.users))
+    db_session: Optional[models.Session] = await db.scalar(stmt)
     if db_session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     return db_session
 
 
-def update(id: uuid.UUID, user: models.User, db: Session) -> models.Session:
-    db_session: Optional[models.Session] = db.query(models.Session).filter(models.Session.id == id).first()
-    if db_session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+async def update(id: uuid.UUID, user: models.User, db: AsyncSession) -> models.Session:
+    db_session = await get(id, db)
     try:
-        eq = models.EmailQueue(user_email=user.email, data=db_session.data, action=models.Action.UPDATE)
-        db.add(eq)
-        db.commit()
+        await _queue_email(db_session, user, models.Action.UPDATE, db)
+        await db.commit()
     except ValueError:
         pass
     return db_session
 
 
-def join(id: uuid.UUID, user: models.User, db: Session) -> models.Session:
-    db_session: Optional[models.Session] = db.query(models.Session).filter(models.Session.id == id).first()
-    if db_session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+async def join(id: uuid.UUID, user: models.User, db: AsyncSession) -> models.Session:
+    db_session = await get(id, db)
     try:
         db_session.users.append(user)
-        eq = models.EmailQueue(user_email=user.email, data=db_session.data, action=models.Action.INVITE)
-        db.add(eq)
-        db.commit()
+        await _queue_email(db_session, user, models.Action.INVITE, db)
+        await db.commit()
     except ValueError:
         pass
     return db_session
 
 
-def leave(id: uuid.UUID, user: models.User, db: Session) -> models.Session:
-    db_session: Optional[models.Session] = db.query(models.Session).filter(models.Session.id == id).first()
-    if db_session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+async def leave(id: uuid.UUID, user: models.User, db: AsyncSession) -> models.Session:
+    db_session = await get(id, db)
     try:
         db_session.users.remove(user)
-        eq = models.EmailQueue(user_email=user.email, data=db_session.data, action=models.Action.CANCEL)
-        db.add(eq)
-        db.commit()
+        await _queue_email(db_session, user, models.Action.CANCEL, db)
+        await db.commit()
     except ValueError:
         pass
     return db_session
+
+
+async def _queue_email(db_session: models.Session, user: models.User, action: models.Action, db: AsyncSession):
+    await db.execute(snapshots.store(db, [db_session.id]))
+    db.add(
+        models.EmailQueue(user_email=user.email, session_id=db_session.id, session_hash=db_session.hash, action=action)
+    )
+    if (stmt := notify(db, models.EmailQueue.__table__)) is not None:
+        await db.execute(stmt)
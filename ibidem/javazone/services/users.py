@@ -1,31 +1,71 @@
 import logging
+import time
 from typing import Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
-from ibidem.javazone.database import models
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.core.lru import LRU
+from ibidem.javazone.database import models, upsert
 from ibidem.javazone.http import schemas
 
 LOG = logging.getLogger(__name__)
 
 
-def create_user(user: schemas.AuthenticatedUser, db: Session) -> models.User:
-    db_user = models.User(
-        email=user.email,
-        name=user.name,
-        picture_url=str(user.picture_url) if user.picture_url else None,
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    LOG.info("Created user %r", user)
-    return db_user
+class KnownUsers:
+    """Users recently written to or read from the database, keyed by email
 
+    Entries expire after `settings.cache.user_max_age`, so users deleted by another replica are forgotten soon after.
+    """
 
-def get_user(user: schemas.AuthenticatedUser, db: Session) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.email == user.email).first()
+    def __init__(self, size: int):
+        self._users: LRU[str, schemas.AuthenticatedUser] = LRU(size)
 
+    def get(self, email: str) -> Optional[schemas.AuthenticatedUser]:
+        return self._users.get(email)
 
-def delete_user(user: schemas.User, db: Session):
-    db.delete(user)
-    db.commit()
+    def put(self, user: schemas.AuthenticatedUser):
+        self._users.put(user.email, user, time.monotonic() + settings.cache.user_max_age)
+
+    def forget(self, email: str):
+        self._users.pop(email)
+
+
+known_users = KnownUsers(settings.cache.user_size)
+
+
+async def resolve_user(user: schemas.AuthenticatedUser, db: AsyncSession) -> models.User:
+    """The stored user for an authenticated user, created or updated as needed
+
+    Users seen recently with the same name and picture are resolved without touching the database.
+    Otherwise the user is upserted in a single statement, so parallel first requests don't race each other.
+    """
+    if known_users.get(user.email) != user:
+        stmt = upsert(db, models.User.__table__, _user_values(user), update=["name", "picture_url"])
+        await db.execute(stmt)
+        await db.commit()
+        known_users.put(user)
+        LOG.debug("Stored user %r", user)
+    db_user = models.User(**_user_values(user))
+    make_transient_to_detached(db_user)
+    return await db.merge(db_user, load=False)
+
+
+async def load_sessions(user: models.User, db: AsyncSession) -> models.User:
+    await db.refresh(user, attribute_names=["sessions"])
+    return user
+
+
+async def delete_user(user: models.User, db: AsyncSession):
+    known_users.forget(user.email)
+    await db.delete(user)
+    await db.commit()
+
+
+def _user_values(user: schemas.AuthenticatedUser) -> dict:
+    return {
+        "email": user.email,
+        "name": user.name,
+        "picture_url": str(user.picture_url) if user.picture_url else None,
+    }
@@ -1,60 +1,167 @@
+import itertools
 import json
 import logging
+import tempfile
 import uuid
+from datetime import datetime
 from hashlib import sha256
+from typing import BinaryIO, Iterator, Optional, Iterable
 
 import requests
+from sqlalchemy import DateTime, cast, delete, insert, literal, select
 from sqlalchemy.orm import Session
 
 from ibidem.javazone.core.config import settings
-from ibidem.javazone.database import models
+from ibidem.javazone.database import models, notify, random_uuid, snapshots, upsert
+from ibidem.javazone.http import schemas
+from ibidem.javazone.services import catalog
+from ibidem.javazone.sleepingpill.jsonstream import CHUNK_SIZE, iter_array
 
 LOG = logging.getLogger(__name__)
 
 DATA_URL = "https://sleepingpill.javazone.no/public/allSessions/javazone_%d"
+REQUEST_TIMEOUT = 60
+SPOOL_SIZE = 4 * 1024 * 1024
+WRITE_BATCH_SIZE = 500
+UPSERT_COLUMNS = ["hash", "data", "title", "start_time", "end_time", "room", "format", "language"]
 
 
-def _load_data(year):
-    resp = requests.get(DATA_URL % year)
-    resp.raise_for_status()
-    raw_data = resp.json()
-    return {uuid.UUID(session["sessionId"]): session for session in raw_data["sessions"]}
+def _download(url: str, state: models.SyncState, body: BinaryIO) -> Optional[str]:
+    """Download url to body, returning the digest of the body, or None if it is unchanged since the last sync
+
+    The validators of the last sync are only sent when it was for the current generation,
+    so bumping the generation always syncs everything.
+    """
+    headers = {}
+    if state.generation == settings.update_generation:
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+    with requests.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+        if resp.status_code == requests.codes.not_modified:
+            return None
+        resp.raise_for_status()
+        digest = sha256()
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            digest.update(chunk)
+            body.write(chunk)
+        state.etag = resp.headers.get("ETag")
+        state.last_modified = resp.headers.get("Last-Modified")
+    body.seek(0)
+    return digest.hexdigest()
+
+
+def _iter_data(body: BinaryIO) -> Iterator[tuple[uuid.UUID, dict]]:
+    for session in iter_array(body, "sessions"):
+        yield uuid.UUID(session["sessionId"]), session
+
+
+def _columns(raw_session: dict) -> dict:
+    """The columns copied from the session data, so listings can be filtered and sorted in the database
+
+    Text is truncated to fit its column, the full value is still in the session data.
+    """
+    session = schemas.Session.model_validate(raw_session)
+    return {
+        "title": _truncate(session.title, models.Session.title),
+        "start_time": session.start_time,
+        "end_time": session.end_time,
+        "room": _truncate(session.room, models.Session.room),
+        "format": _truncate(session.format, models.Session.format),
+        "language": _truncate(session.language, models.Session.language),
+    }
+
+
+def _truncate(value: Optional[str], column) -> Optional[str]:
+    return value[: column.type.length] if value is not None else None
 
 
 def update_sessions(db: Session):
     LOG.info("Updating sessions to generation %d", settings.update_generation)
+    url = DATA_URL % settings.year
+    state = db.get(models.SyncState, url) or models.SyncState(source=url)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as body:
+        digest = _download(url, state, body)
+        if digest is None:
+            LOG.info("Sessions not modified since the last update")
+            return
+        if digest == state.digest and state.generation == settings.update_generation:
+            LOG.info("Sessions unchanged since the last update")
+        else:
+            _update_sessions(_iter_data(body), db)
+            if (stmt := notify(db, models.Session.__table__)) is not None:
+                db.execute(stmt)
+    state.generation = settings.update_generation
+    state.digest = digest
+    state.synced_at = datetime.now()
+    db.add(state)
+    db.commit()
+    catalog.invalidate()
+
+
+def _update_sessions(data: Iterator[tuple[uuid.UUID, dict]], db: Session):
+    """Write added and changed sessions, and remove those no longer in data
+
+    Only ids and hashes are read up front, and sessions are written in batches of WRITE_BATCH_SIZE.
+    """
     generation_suffix = f"-gen{settings.update_generation}".encode("utf-8")
-    data = _load_data(settings.year)
-    db_sessions = {db_session.id: db_session for db_session in db.query(models.Session).all()}
-    needs_delete = set(db_sessions.keys())
-    needs_update = set()
+    stmt = select(models.Session.id, models.Session.hash, models.Session.title.is_(None).label("needs_columns"))
+    known = {row.id: row for row in db.execute(stmt)}
+    upsert_stmt = upsert(db, models.Session.__table__, None, update=UPSERT_COLUMNS)
+    needs_delete = set(known.keys())
+    needs_update = []
     added = 0
-    for session_id in data:
+    rows = []
+    for session_id, raw_session in data:
         needs_delete.discard(session_id)
-        session_data = json.dumps(data[session_id], indent=None)
+        session_data = json.dumps(raw_session, indent=None)
         session_hash = sha256(session_data.encode("utf-8") + generation_suffix).hexdigest()
         LOG.debug("Processing %s (hash: %s)", session_id, session_hash)
-        db_session = db_sessions.get(session_id)
-        if db_session:
-            if session_hash != db_session.hash:
-                db_session.data = session_data
-                db_session.hash = session_hash
-                needs_update.add(db_session)
-        else:
-            db_session = models.Session(id=session_id, hash=session_hash, data=session_data)
-            db.add(db_session)
+        row = known.get(session_id)
+        if row is None:
             added += 1
-    for session_id in needs_delete:
-        db_session = db_sessions[session_id]
-        db.delete(db_session)
-        for user in db_session.users:
-            eq = models.EmailQueue(user_email=user.email, data=db_session.data, action=models.Action.CANCEL)
-            db.add(eq)
-    for db_session in needs_update:
-        for user in db_session.users:
-            eq = models.EmailQueue(user_email=user.email, data=db_session.data, action=models.Action.UPDATE)
-            db.add(eq)
-    db.commit()
+        elif session_hash != row.hash:
+            needs_update.append(session_id)
+        elif not row.needs_columns:
+            continue
+        rows.append({"id": session_id, "hash": session_hash, "data": session_data, **_columns(raw_session)})
+        if len(rows) >= WRITE_BATCH_SIZE:
+            db.execute(upsert_stmt, rows)
+            rows = []
+    if rows:
+        db.execute(upsert_stmt, rows)
+    for batch in itertools.batched(needs_delete, WRITE_BATCH_SIZE):
+        _queue_emails(batch, models.Action.CANCEL, db)
+        db.execute(delete(models.user_session).where(models.user_session.c.session_id.in_(batch)))
+        db.execute(delete(models.Session).where(models.Session.id.in_(batch)))
+    for batch in itertools.batched(needs_update, WRITE_BATCH_SIZE):
+        _queue_emails(batch, models.Action.UPDATE, db)
     LOG.info("Scheduled updates for %d sessions", len(needs_update))
     LOG.info("Scheduled cancellation for %d sessions", len(needs_delete))
     LOG.info("Added %d new sessions to database", added)
+
+
+def _queue_emails(session_ids: Iterable[uuid.UUID], action: models.Action, db: Session):
+    """Queue an email to every attendee of the sessions, in a single statement regardless of the number of attendees"""
+    action_value = literal(action, models.EmailQueue.action.type)
+    if db.get_bind().dialect.name == "postgresql":
+        # An untyped parameter in a select list is text to PostgreSQL, which won't insert text into an enum column
+        action_value = cast(action_value, models.EmailQueue.action.type)
+    attendees = (
+        select(
+            random_uuid(db),
+            models.user_session.c.user_email,
+            models.user_session.c.session_id,
+            models.Session.hash,
+            action_value,
+            literal(datetime.now(), DateTime),
+        )
+        .join(models.Session, models.Session.id == models.user_session.c.session_id)
+        .where(models.user_session.c.session_id.in_(session_ids))
+    )
+    columns = ["id", "user_email", "session_id", "session_hash", "action", "scheduled_at"]
+    db.execute(snapshots.store(db, session_ids))
+    db.execute(insert(models.EmailQueue.__table__).from_select(columns, attendees))
+    if (stmt := notify(db, models.EmailQueue.__table__)) is not None:
+        db.execute(stmt)
@@ -0,0 +1,96 @@
+import codecs
+import json
+import re
+from typing import BinaryIO, Iterator, Any
+
+CHUNK_SIZE = 64 * 1024
+# A number ending this close to the end of the buffer might continue in the next chunk, as in "1." "5" or "1e" "-3"
+LOOKAHEAD = 3
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonStream:
+    """Decodes a JSON document one value at a time, reading only as much of the file as needed"""
+
+    def __init__(self, fp: BinaryIO):
+        self._reader = codecs.getreader("utf-8")(fp)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+
+    def peek(self) -> str:
+        """The next character that is not whitespace"""
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON document, found {found!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            if len(self._buffer) - end < LOOKAHEAD and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _fill(self) -> bool:
+        chunk = self._reader.read(CHUNK_SIZE)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+
+def iter_array(fp: BinaryIO, key: str) -> Iterator[Any]:
+    """The items of the array under key in a top level JSON object, one at a time
+
+    Raises ValueError if the object has no key, once the whole object has been read.
+    """
+    stream = JsonStream(fp)
+    stream.expect("{")
+    found = False
+    if stream.peek() == "}":
+        stream.expect("}")
+    else:
+        while True:
+            name = stream.value()
+            stream.expect(":")
+            if name == key:
+                found = True
+                yield from _iter_items(stream)
+            else:
+                stream.value()
+            if stream.peek() != ",":
+                stream.expect("}")
+                break
+            stream.expect(",")
+    if not found:
+        raise ValueError(f"No {key!r} in JSON document")
+
+
+def _iter_items(stream: JsonStream) -> Iterator[Any]:
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.expect("]")
+        return
+    while True:
+        yield stream.value()
+        if stream.peek() != ",":
+            stream.expect("]")
+            return
+        stream.expect(",")
@@ -0,0 +1,101 @@
+import functools
+import logging
+import os
+from typing import Hashable, Callable
+
+import jinja2
+from fastapi import Request
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.core.lru import LRU
+from ibidem.javazone.precompile import PACKAGE
+
+LOG = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """A bounded LRU cache of rendered template fragments"""
+
+    def __init__(self, size: int):
+        self._fragments: LRU[Hashable, str] = LRU(size)
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> str:
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self.hits += 1
+            return fragment
+        self.misses += 1
+        fragment = render()
+        self._fragments.put(key, fragment)
+        return fragment
+
+
+fragment_cache = FragmentCache(settings.cache.fragment_size)
+
+
+def is_attending(user, session) -> bool:
+    return user.email in session.attendee_emails
+
+
+def render_session_fragment(request: Request, name: str, session, user) -> str:
+    """Render a session widget, reusing earlier renders of the same version of the session
+
+    The widgets only depend on the session and on whether the user attends it, so sessions with a known hash
+    are cached by template, hash and membership.
+    """
+
+    def render():
+        return get_templates().get_template(name).render(request=request, session=session, user=user)
+
+    if session.hash is None:
+        return render()
+    key = (name, session.hash, is_attending(user, session), str(request.base_url))
+    return fragment_cache.get_or_render(key, render)
+
+
+@jinja2.pass_context
+def render_session(context: jinja2.runtime.Context, name: str, session) -> Markup:
+    return Markup(render_session_fragment(context["request"], name, session, context["user"]))
+
+
+@functools.cache
+def get_environment() -> jinja2.Environment:
+    """The process-wide template environment
+
+    Templates are looked up in the precompiled modules first, if configured, and compiled templates are cached
+    as bytecode on disk, so restarts don't have to compile them again.
+    """
+    loaders = [jinja2.PackageLoader(PACKAGE)]
+    precompiled_dir = settings.templates.precompiled_dir
+    if precompiled_dir and not settings.debug:
+        if os.path.isdir(precompiled_dir):
+            loaders.insert(0, jinja2.ModuleLoader(precompiled_dir))
+        else:
+            LOG.warning("Precompiled templates not found in %s, compiling at runtime", precompiled_dir)
+    env = jinja2.Environment(
+        loader=jinja2.ChoiceLoader(loaders),
+        autoescape=True,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(settings.templates.bytecode_cache_dir),
+        auto_reload=settings.debug,
+    )
+    env.globals["is_attending"] = is_attending
+    env.globals["render_session"] = render_session
+    return env
+
+
+@functools.cache
+def get_templates() -> Jinja2Templates:
+    return Jinja2Templates(env=get_environment())
+
+
+def warm_up():
+    """Load every template, so compilation happens at startup instead of in the first requests"""
+    env = get_environment()
+    names = jinja2.PackageLoader(PACKAGE).list_templates()
+    for name in names:
+        env.get_template(name)
+    LOG.info("Loaded %d templates", len(names))
@@ -0,0 +1,127 @@
+import asyncio
+import datetime
+import logging
+from typing import Callable
+
+import anyio
+import psycopg
+from sqlalchemy import Table
+from sqlalchemy.engine import make_url
+
+from ibidem.javazone import database, mail, sleepingpill
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.database import models
+from ibidem.javazone.mail import smtp
+
+LOG = logging.getLogger(__name__)
+
+
+class Wakeup:
+    """Waits for the next poll, or until a table announces a change, whichever comes first
+
+    On PostgreSQL, changes are announced with NOTIFY on a channel named after the table, see `database.notify`, and
+    we LISTEN on a connection of our own. Other databases can't tell us, so there we simply wait for the next poll.
+    """
+
+    def __init__(self, table: Table):
+        self._url = make_url(str(settings.database.dsn()))
+        self._channel = table.name
+        self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._url.get_backend_name() == "postgresql"
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for up to timeout seconds, returning whether the table announced a change"""
+        if not self.enabled:
+            await asyncio.sleep(timeout)
+            return False
+        notified = False
+        try:
+            if self._conn is None:
+                self._conn = await self._connect()
+            async for _ in self._conn.notifies(timeout=timeout, stop_after=1):
+                notified = True
+        except Exception as e:
+            LOG.warning("Failed to listen for changes to %s, polling instead: %s", self._channel, e)
+            await self.close()
+            await asyncio.sleep(timeout)
+        return notified
+
+    async def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    async def _connect(self) -> psycopg.AsyncConnection:
+        dsn = self._url.set(drivername="postgresql").render_as_string(hide_password=False)
+        conn = await psycopg.AsyncConnection.connect(dsn, autocommit=True)
+        await conn.execute(f"LISTEN {self._channel}")
+        return conn
+
+
+async def run():
+    """Process the email queue as emails arrive, and sync sessions and purge old emails on a schedule"""
+    database.init()
+    wakeup = Wakeup(models.EmailQueue.__table__)
+    try:
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(_drain_queue(wakeup))
+            if settings.worker.sync_interval > 0:
+                tasks.create_task(_every(_sync_interval, _sync_sessions))
+            tasks.create_task(_every(lambda: settings.worker.purge_interval, _purge_queue))
+    finally:
+        await wakeup.close()
+        smtp.pool.close()
+
+
+async def _drain_queue(wakeup: Wakeup):
+    """Process the queue, polling more rarely the longer it stays empty, up to `settings.worker.poll_max`"""
+    interval = settings.worker.poll_min
+    while True:
+        sent = 0
+        try:
+            sent = await anyio.to_thread.run_sync(_process_queue)
+        except Exception:
+            LOG.exception("Failed to process email queue")
+        interval = settings.worker.poll_min if sent else min(interval * 2, settings.worker.poll_max)
+        await wakeup.wait(interval)
+
+
+async def _every(interval: Callable[[], float], job):
+    """Run job in a thread, then again after the number of seconds interval returns, for as long as the worker runs"""
+    while True:
+        try:
+            await anyio.to_thread.run_sync(job)
+        except Exception:
+            LOG.exception("Failed to run %s", job.__name__)
+        await asyncio.sleep(interval())
+
+
+def _sync_interval() -> float:
+    return settings.worker.sync_interval_for(datetime.date.today())
+
+
+def _process_queue() -> int:
+    db = database.get_session()
+    try:
+        return mail.process_queue(db)
+    finally:
+        db.close()
+
+
+def _sync_sessions():
+    db = database.get_session()
+    try:
+        sleepingpill.update_sessions(db)
+    finally:
+        db.close()
+
+
+def _purge_queue():
+    db = database.get_session()
+    try:
+        mail.purge_queue(db)
+    finally:
+        db.close()
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from hashlib import sha256
+
+import pytest
+
+_db_dir = tempfile.mkdtemp(prefix="javazone-test-")
+os.environ.setdefault("DATABASE__URL", f"sqlite+pysqlite:///{_db_dir}/javazone.db")
+os.environ.setdefault("OAUTH__CLIENT_ID", "debug@example.com")
+os.environ.setdefault("OAUTH__CLIENT_SECRET", "secret")
+
+
+def _default_start_time(i):
+    return datetime(2025, 9, 3, 9) + timedelta(hours=i % 8)
+
+
+def seed_sessions(count, attendees=0, start_time=_default_start_time):
+    """Replace all sessions and users with count sessions, attended by the given number of users and the debug user"""
+    from ibidem.javazone.core.config import settings
+    from ibidem.javazone.database import get_session, models
+    from ibidem.javazone.services import catalog
+    from ibidem.javazone.sleepingpill import _columns
+
+    db = get_session()
+    try:
+        db.execute(models.user_session.delete())
+        db.query(models.Session).delete()
+        db.query(models.User).delete()
+        users = [models.User(email=f"user{i}@example.com", name=f"User {i}") for i in range(attendees)]
+        users.append(models.User(email=settings.oauth.client_id, name="Debug User"))
+        db.add_all(users)
+        for i in range(count):
+            start = start_time(i)
+            data = json.dumps(
+                {
+                    "id": str(uuid.UUID(int=i + 1)),
+                    "conferenceId": str(uuid.UUID(int=0)),
+                    "intendedAudience": "Everyone",
+                    "length": 45,
+                    "format": "lightning-talk" if i % 2 else "presentation",
+                    "language": "no" if i % 3 == 0 else "en",
+                    "abstract": "Abstract",
+                    "title": f"Session {i}",
+                    "room": f"Room {i % 5}",
+                    "startTime": start.isoformat() if start else None,
+                    "endTime": (start + timedelta(minutes=45)).isoformat() if start else None,
+                    "startSlot": start.isoformat() if start else None,
+                    "speakers": [{"name": f"Speaker {i}"}],
+                }
+            )
+            db_session = models.Session(
+                id=uuid.UUID(int=i + 1),
+                hash=sha256(data.encode("utf-8")).hexdigest(),
+                data=data,
+                **_columns(json.loads(data)),
+            )
+            db_session.users.extend(users)
+            db.add(db_session)
+        db.commit()
+    finally:
+        db.close()
+    catalog.invalidate()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    from ibidem.javazone.main import app
+
+    with TestClient(app) as client:
+        yield client
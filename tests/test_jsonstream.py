@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from ibidem.javazone.sleepingpill import jsonstream
+from ibidem.javazone.sleepingpill.jsonstream import iter_array
+
+DOCUMENT = {
+    "before": {"nested": [1, 2.5, None], "skipped": "value, with ] and }"},
+    "sessions": [
+        -25000000000.0,
+        1e10,
+        1.5e-3,
+        -2.5e100,
+        -0,
+        123456789,
+        True,
+        False,
+        None,
+        "",
+        'Øyvind Bærlevåg ☃ \\ " \n',
+        [],
+        {},
+        {"sessionId": "1", "title": "Title", "speakers": [{"name": "Speaker"}], "length": 45},
+        [[1.0], {"a": [1e1, -1]}],
+    ],
+    "after": 12.75,
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 7, 11, 13, 64, 64 * 1024])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_array_matches_json_loads(monkeypatch, chunk_size, indent):
+    monkeypatch.setattr(jsonstream, "CHUNK_SIZE", chunk_size)
+    document = json.dumps(DOCUMENT, indent=indent, ensure_ascii=False).encode("utf-8")
+
+    assert list(iter_array(io.BytesIO(document), "sessions")) == json.loads(document)["sessions"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 6, 7, 8, 13])
+@pytest.mark.parametrize("number", ["-25000000000.0", "1.5e-3", "1E+10", "-0.5", "10", "3.25E2"])
+def test_numbers_split_at_chunk_boundaries(monkeypatch, chunk_size, number):
+    monkeypatch.setattr(jsonstream, "CHUNK_SIZE", chunk_size)
+    document = f'{{"sessions": [{number},{number}, {number}]}}'
+
+    assert list(iter_array(io.BytesIO(document.encode("utf-8")), "sessions")) == json.loads(document)["sessions"]
+
+
+@pytest.mark.parametrize("document", ['{"sessions": []}', '{"other": [], "sessions": []}'])
+def test_no_items(document):
+    assert list(iter_array(io.BytesIO(document.encode("utf-8")), "sessions")) == []
+
+
+@pytest.mark.parametrize("document", ["", "[]", "{}", '{"other": []}', '{"sessions": [1, 2', '{"sessions": [1 2]}'])
+def test_invalid_documents(document):
+    with pytest.raises(ValueError):
+        list(iter_array(io.BytesIO(document.encode("utf-8")), "sessions"))
@@ -0,0 +1,44 @@
+from ibidem.javazone.core.lru import LRU
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    lru = LRU(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert len(lru) == 2
+
+
+def test_drops_entries_when_they_expire():
+    clock = Clock()
+    lru = LRU(2, clock=clock)
+    lru.put("a", 1, expires_at=10)
+    lru.put("b", 2)
+
+    clock.now = 9.9
+    assert lru.get("a") == 1
+    clock.now = 10
+    assert lru.get("a") is None
+    assert lru.get("b") == 2
+    assert len(lru) == 1
+
+
+def test_pop():
+    lru = LRU(2)
+    lru.put("a", 1)
+    lru.pop("a")
+    lru.pop("missing")
+
+    assert lru.get("a") is None
@@ -0,0 +1,279 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+from ibidem.javazone import mail
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.database import get_session, models
+from ibidem.javazone.mail import coalesce, coalesce_queue, process_queue, purge_queue
+
+INVITE = models.Action.INVITE
+UPDATE = models.Action.UPDATE
+CANCEL = models.Action.CANCEL
+
+
+@pytest.mark.parametrize(
+    "actions, expected",
+    [
+        ([INVITE], INVITE),
+        ([INVITE, CANCEL], None),
+        ([INVITE, CANCEL, INVITE], INVITE),
+        ([INVITE, UPDATE, UPDATE], INVITE),
+        ([UPDATE, UPDATE], UPDATE),
+        ([UPDATE, CANCEL], CANCEL),
+        ([CANCEL, INVITE], INVITE),
+        ([CANCEL, INVITE, CANCEL], CANCEL),
+    ],
+)
+def test_coalesce(actions, expected):
+    assert coalesce(actions) == expected
+
+
+def test_coalesce_queue():
+    db = get_session()
+    try:
+        db.query(models.EmailQueue).delete()
+        session_id = uuid.uuid4()
+        start = datetime(2025, 9, 1)
+        for i, (email, action) in enumerate(
+            [
+                ("a@example.com", INVITE),
+                ("a@example.com", CANCEL),
+                ("b@example.com", UPDATE),
+                ("b@example.com", UPDATE),
+                ("c@example.com", CANCEL),
+            ]
+        ):
+            db.add(
+                models.EmailQueue(
+                    user_email=email,
+                    session_id=session_id,
+                    session_hash="hash",
+                    action=action,
+                    scheduled_at=start + timedelta(minutes=i),
+                )
+            )
+        db.commit()
+
+        assert coalesce_queue(db) == 3
+
+        pending = db.query(models.EmailQueue).filter(models.EmailQueue.sent_at.is_(None))
+        assert sorted((eq.user_email, eq.action) for eq in pending) == [
+            ("b@example.com", UPDATE),
+            ("c@example.com", CANCEL),
+        ]
+    finally:
+        db.close()
+
+
+def test_process_queue_retries_and_gives_up(monkeypatch):
+    monkeypatch.setattr(settings.mail, "max_attempts", 2)
+    monkeypatch.setattr(mail, "_load_session", mock.Mock())
+    send = mock.Mock(side_effect=RuntimeError("mailbox unavailable"))
+    monkeypatch.setattr(mail, "_send", send)
+    db = get_session()
+    try:
+        db.query(models.EmailQueue).delete()
+        eq = models.EmailQueue(user_email="a@example.com", session_id=uuid.uuid4(), action=INVITE)
+        db.add(eq)
+        db.commit()
+
+        process_queue(db)
+        assert (eq.attempts, eq.last_error, eq.failed_at) == (1, "mailbox unavailable", None)
+        assert eq.retry_at > datetime.now()
+
+        process_queue(db)
+        assert send.call_count == 1
+
+        eq.retry_at = datetime.now()
+        db.commit()
+        process_queue(db)
+        assert send.call_count == 2
+        assert eq.attempts == 2
+        assert eq.failed_at is not None
+        assert eq.sent_at is None
+    finally:
+        db.close()
+
+
+def test_purge_queue():
+    db = get_session()
+    try:
+        db.query(models.EmailQueue).delete()
+        db.query(models.SessionSnapshot).delete()
+        old = datetime.now() - timedelta(days=settings.mail.retention_days + 1)
+        db.add_all(
+            [
+                models.SessionSnapshot(hash="old", data="{}"),
+                models.SessionSnapshot(hash="new", data="{}"),
+                models.EmailQueue(user_email="a@example.com", session_hash="old", action=INVITE, sent_at=old),
+                models.EmailQueue(
+                    user_email="b@example.com", session_hash="new", action=INVITE, sent_at=datetime.now()
+                ),
+                models.EmailQueue(user_email="c@example.com", session_hash="new", action=INVITE, failed_at=old),
+            ]
+        )
+        db.commit()
+
+        assert purge_queue(db) == 1
+
+        assert sorted(eq.user_email for eq in db.query(models.EmailQueue)) == ["b@example.com", "c@example.com"]
+        assert [snapshot.hash for snapshot in db.query(models.SessionSnapshot)] == ["new"]
+    finally:
+        db.close()
+
+
+def test_process_queue_sends_in_threads(monkeypatch):
+    loaded, sent = [], []
+
+    def load_session(eq, db):
+        loaded.append(threading.current_thread().name)
+
+    def send(eq, session, url_for):
+        sent.append(threading.current_thread().name)
+        return True
+
+    monkeypatch.setattr(mail, "_load_session", load_session)
+    monkeypatch.setattr(mail, "_send", send)
+    db = get_session()
+    try:
+        db.query(models.EmailQueue).delete()
+        for i in range(3):
+            db.add(models.EmailQueue(user_email=f"{i}@example.com", session_id=uuid.uuid4(), action=INVITE))
+        db.commit()
+
+        assert process_queue(db) == 3
+        assert loaded == [threading.main_thread().name] * 3
+        assert len(sent) == 3
+        assert all(name.startswith("mail") for name in sent)
+    finally:
+        db.close()
+
+
+def _queue(db, count, **kwargs):
+    db.query(models.EmailQueue).delete()
+    queue = [
+        models.EmailQueue(
+            user_email=f"{i}@example.com",
+            session_id=uuid.uuid4(),
+            action=INVITE,
+            scheduled_at=datetime.now() - timedelta(minutes=count - i),
+            **kwargs,
+        )
+        for i in range(count)
+    ]
+    db.add_all(queue)
+    db.commit()
+    return [eq.user_email for eq in queue]
+
+
+def test_claim_is_exclusive(monkeypatch):
+    db, other = get_session(), get_session()
+    try:
+        emails = _queue(db, 5)
+
+        monkeypatch.setattr(mail, "WORKER_ID", "first")
+        first = mail.claim(db, 3)
+        monkeypatch.setattr(mail, "WORKER_ID", "second")
+        second = mail.claim(other, 10)
+
+        assert [eq.user_email for eq in first] == emails[:3]
+        assert [eq.user_email for eq in second] == emails[3:]
+        assert {eq.claimed_by for eq in first} == {"first"}
+        assert {eq.claimed_by for eq in second} == {"second"}
+        assert mail.claim(db, 10) == []
+    finally:
+        db.close()
+        other.close()
+
+
+def test_claim_takes_over_expired_leases(monkeypatch):
+    db = get_session()
+    try:
+        _queue(db, 2)
+        monkeypatch.setattr(mail, "WORKER_ID", "dead")
+        expired, alive = mail.claim(db, 2)
+        expired.lease_until = datetime.now() - timedelta(seconds=1)
+        db.commit()
+
+        monkeypatch.setattr(mail, "WORKER_ID", "alive")
+        assert [eq.id for eq in mail.claim(db, 2)] == [expired.id]
+        assert (expired.claimed_by, alive.claimed_by) == ("alive", "dead")
+    finally:
+        db.close()
+
+
+def test_claim_waits_for_retry_at():
+    db = get_session()
+    try:
+        _queue(db, 1, retry_at=datetime.now() + timedelta(minutes=1))
+        assert mail.claim(db, 1) == []
+
+        eq = db.query(models.EmailQueue).one()
+        eq.retry_at = datetime.now() - timedelta(seconds=1)
+        db.commit()
+        assert mail.claim(db, 1) == [eq]
+    finally:
+        db.close()
+
+
+def test_coalesce_queue_leaves_emails_claimed_meanwhile(monkeypatch):
+    supersede = mail._supersede
+
+    def claim_then_supersede(db, ids, keep, action, now):
+        # Another worker claims the invite after it was read, and will send it
+        other = get_session()
+        try:
+            other.query(models.EmailQueue).filter(models.EmailQueue.action == INVITE).update(
+                {"claimed_by": "other", "lease_until": datetime.max}
+            )
+            other.commit()
+        finally:
+            other.close()
+        return supersede(db, ids, keep, action, now)
+
+    monkeypatch.setattr(mail, "_supersede", claim_then_supersede)
+    db = get_session()
+    try:
+        _queue(db, 2)
+        session_id = uuid.uuid4()
+        for eq, action in zip(db.query(models.EmailQueue).order_by(models.EmailQueue.scheduled_at), [INVITE, CANCEL]):
+            eq.user_email, eq.session_id, eq.action = "a@example.com", session_id, action
+        db.commit()
+
+        assert coalesce_queue(db) == 0
+
+        assert db.query(models.EmailQueue).filter(models.EmailQueue.sent_at.is_not(None)).count() == 0
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("result", [True, RuntimeError("mailbox unavailable")])
+def test_process_queue_keeps_lost_leases(monkeypatch, result):
+    monkeypatch.setattr(mail, "_load_session", mock.Mock())
+
+    def send(eq, session, url_for):
+        # Another worker takes over the email while it is being sent, after our lease has run out
+        other = get_session()
+        try:
+            other.query(models.EmailQueue).update({"claimed_by": "other", "lease_until": datetime.max})
+            other.commit()
+        finally:
+            other.close()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(mail, "_send", send)
+    db = get_session()
+    try:
+        _queue(db, 1)
+        process_queue(db)
+
+        eq = db.query(models.EmailQueue).one()
+        assert (eq.claimed_by, eq.sent_at, eq.attempts, eq.retry_at) == ("other", None, 0, None)
+    finally:
+        db.close()
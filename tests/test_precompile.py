@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+import jinja2
+
+from ibidem.javazone.precompile import PACKAGE
+
+
+def test_compiles_templates_without_app_settings(tmp_path):
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("OAUTH__", "DATABASE__"))}
+
+    subprocess.run([sys.executable, "-m", "ibidem.javazone.precompile", str(tmp_path)], env=env, check=True)
+
+    names = jinja2.PackageLoader(PACKAGE).list_templates()
+    loader = jinja2.ModuleLoader(str(tmp_path))
+    compiled = jinja2.Environment(loader=loader, autoescape=True)
+    for name in names:
+        compiled.get_template(name)
+    assert len(list(tmp_path.iterdir())) == len(names)
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from authlib.jose import JsonWebKey, JsonWebToken
+from authlib.jose.errors import DecodeError
+
+from ibidem.javazone import security
+
+JWKS_URI = "https://example.com/jwks"
+
+
+class Provider:
+    """Serves OIDC metadata and the current signing keys, counting how often the keys are fetched"""
+
+    def __init__(self):
+        self.keys = [JsonWebKey.generate_key("RSA", 2048, {"kid": "one"}, is_private=True)]
+        self.loads = 0
+
+    async def get_json(self, client, url):
+        if url == JWKS_URI:
+            self.loads += 1
+            return {"keys": [key.as_dict() for key in self.keys]}
+        return {"jwks_uri": JWKS_URI, security.SUPPORTED_ALGS_KEY: ["RS256"]}
+
+    def rotate(self, kid):
+        self.keys = [JsonWebKey.generate_key("RSA", 2048, {"kid": kid}, is_private=True)]
+
+    def token(self, **claims):
+        key = self.keys[0]
+        header = {"alg": "RS256", "kid": key.kid}
+        return JsonWebToken(["RS256"]).encode(header, {"sub": "someone", **claims}, key).decode("utf-8")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    fake_time = SimpleNamespace(monotonic=lambda: clock.now, time=lambda: clock.now)
+    monkeypatch.setattr(security, "time", fake_time)
+    return clock
+
+
+@pytest.fixture
+def provider(monkeypatch, clock):
+    provider = Provider()
+    monkeypatch.setattr(security, "_get_json", provider.get_json)
+    monkeypatch.setattr(security, "key_cache", security.KeyCache("https://example.com/.well-known"))
+    monkeypatch.setattr(security, "claims_cache", security.ClaimsCache(10))
+    return provider
+
+
+def test_refreshes_keys_for_unknown_kid_at_most_once_per_interval(provider, clock):
+    assert asyncio.run(security.decode_token(provider.token()))["sub"] == "someone"
+    assert provider.loads == 1
+
+    provider.rotate("two")
+    rotated = provider.token()
+    clock.now += security.MIN_FORCED_REFRESH_INTERVAL / 2
+    with pytest.raises(DecodeError):
+        asyncio.run(security.decode_token(rotated))
+    assert provider.loads == 1
+
+    clock.now += security.MIN_FORCED_REFRESH_INTERVAL
+    assert asyncio.run(security.decode_token(rotated))["sub"] == "someone"
+    assert provider.loads == 2
+
+    provider.rotate("three")
+    with pytest.raises(DecodeError):
+        asyncio.run(security.decode_token(provider.token()))
+    assert provider.loads == 2
+
+
+def test_claims_are_cached_until_token_expires(provider, clock):
+    token = provider.token(exp=int(clock.now) + 60)
+    asyncio.run(security.decode_token(token))
+    provider.rotate("two")
+
+    clock.now += 59
+    assert asyncio.run(security.decode_token(token))["sub"] == "someone"
+
+    clock.now += 1
+    assert security.claims_cache.get(security.sha256(token.encode("utf-8")).digest()) is None
+
+
+def test_claims_without_expiry_are_not_cached(clock):
+    cache = security.ClaimsCache(10)
+    cache.put(b"no exp", {"sub": "someone"})
+    cache.put(b"expired", {"sub": "someone", "exp": clock.now})
+
+    assert cache.get(b"no exp") is None
+    assert cache.get(b"expired") is None
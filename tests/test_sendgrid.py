@@ -0,0 +1,91 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from icalendar import Calendar
+from pydantic import SecretStr
+
+from conftest import seed_sessions
+from ibidem.javazone.core import config
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.database import get_session, models
+from ibidem.javazone.mail import process_queue, sendgrid
+
+
+class FakeSendgrid(BaseHTTPRequestHandler):
+    """Accepts every message, and remembers which connection it came in on"""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.client_address, self.path, self.headers["Authorization"], body))
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_sendgrid(monkeypatch):
+    FakeSendgrid.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSendgrid)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings.mail, "provider", config.MailProvider.SEND_GRID)
+    monkeypatch.setattr(settings.mail, "sender_email", "calendar@example.com")
+    monkeypatch.setattr(settings.mail.sendgrid, "api_key", SecretStr("key"))
+    monkeypatch.setattr(settings.mail.sendgrid, "host", f"http://127.0.0.1:{server.server_port}")
+    sendgrid.client.cache_clear()
+    yield FakeSendgrid.requests
+    sendgrid.client().close()
+    sendgrid.client.cache_clear()
+    server.shutdown()
+    server.server_close()
+
+
+def test_process_queue_sends_each_recipient_their_own_calendar(fake_sendgrid, monkeypatch):
+    monkeypatch.setattr(settings.mail, "batch_size", 2)
+    monkeypatch.setattr(settings.mail, "concurrency", 1)
+    seed_sessions(1, attendees=4)
+    db = get_session()
+    try:
+        db.query(models.EmailQueue).delete()
+        session = db.query(models.Session).one()
+        actions = [models.Action.UPDATE, models.Action.UPDATE, models.Action.UPDATE, models.Action.CANCEL]
+        for i, action in enumerate(actions):
+            db.add(models.EmailQueue(user_email=f"user{i}@example.com", data=session.data, action=action))
+        db.commit()
+
+        assert process_queue(db) == 4
+    finally:
+        db.close()
+
+    assert len(fake_sendgrid) == 4
+    assert len({address for address, _, _, _ in fake_sendgrid}) == 1
+    recipients = []
+    for _, path, authorization, body in fake_sendgrid:
+        assert (path, authorization) == (sendgrid.SEND_PATH, "Bearer key")
+        [personalization] = body["personalizations"]
+        [to] = personalization["to"]
+        content = body["content"][0]["value"]
+        attachment = base64.b64decode(body["attachments"][0]["content"]).decode("utf-8")
+        assert content == attachment
+        [event] = Calendar.from_ical(content).walk("VEVENT")
+        assert str(event["attendee"]) == f"MAILTO:{to['email']}"
+        recipients.append((to["email"], body["subject"]))
+    assert sorted(recipients) == [
+        ("user0@example.com", "Session 0"),
+        ("user1@example.com", "Session 0"),
+        ("user2@example.com", "Session 0"),
+        ("user3@example.com", "Cancelled: Session 0"),
+    ]
+
+
+def test_client_is_shared(fake_sendgrid):
+    assert sendgrid.client() is sendgrid.client()
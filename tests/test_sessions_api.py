@@ -0,0 +1,185 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.services import catalog
+
+from conftest import seed_sessions
+
+
+class TestSessionsIcs:
+    def test_links_do_not_depend_on_host(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "base_url", "https://javazone.example.com/")
+        seed_sessions(3)
+
+        bodies = {client.get("/api/v1/sessions.ics", headers={"Host": host}).content for host in ("a.test", "b.test")}
+
+        assert len(bodies) == 1
+        body = bodies.pop().replace(b"\r\n ", b"")
+        assert b"Join here: https://javazone.example.com/sessions/00000000-0000-0000-0000-000000000001/join" in body
+        assert b"a.test" not in body
+        snapshot = catalog._catalog._snapshot
+        assert all(entry._fragments.keys() == {"ics"} for entry in snapshot.entries)
+
+
+@pytest.mark.parametrize("path", ["/api/v1/sessions", "/api/v1/sessions.ics"])
+class TestSessionsETag:
+    def test_not_modified(self, client, path):
+        seed_sessions(3)
+        etag = client.get(path).headers["ETag"]
+
+        for if_none_match in (etag, f'"other", W/{etag}', "*"):
+            resp = client.get(path, headers={"If-None-Match": if_none_match})
+            assert resp.status_code == 304
+            assert resp.headers["ETag"] == etag
+            assert resp.content == b""
+        assert client.get(path, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_changes_after_sync(self, client, path):
+        seed_sessions(3)
+        etag = client.get(path).headers["ETag"]
+
+        seed_sessions(3, start_time=lambda i: datetime(2025, 9, 4, 9 + i))
+        resp = client.get(path, headers={"If-None-Match": etag})
+
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != etag
+
+    def test_changes_with_generation(self, client, path, monkeypatch):
+        seed_sessions(3)
+        etag = client.get(path).headers["ETag"]
+
+        monkeypatch.setattr(settings, "update_generation", settings.update_generation + 1)
+        catalog.invalidate()
+        resp = client.get(path, headers={"If-None-Match": etag})
+
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != etag
+
+
+def _two_days(i):
+    if i < 6:
+        return datetime(2025, 9, 3, 9 + i)
+    return datetime(2025, 9, 4, 3 + i)
+
+
+class TestSessionsFilters:
+    @pytest.fixture(autouse=True)
+    def sessions(self):
+        seed_sessions(8, start_time=_two_days)
+
+    @pytest.mark.parametrize(
+        "params, expected",
+        [
+            ({"day": "2025-09-04"}, [6, 7]),
+            ({"starts_after": "2025-09-03T12:00:00"}, [3, 4, 5, 6, 7]),
+            ({"starts_after": "2025-09-03T12:00:00+02:00"}, [3, 4, 5, 6, 7]),
+            ({"starts_after": "2025-09-03T10:00:00Z"}, [3, 4, 5, 6, 7]),
+            ({"starts_before": "2025-09-03T11:00:00"}, [0, 1]),
+            ({"starts_before": "2025-09-03T11:00:00+02:00"}, [0, 1]),
+            ({"starts_after": "2025-09-03T08:00:00-01:00", "starts_before": "2025-09-04"}, [2, 3, 4, 5]),
+            ({"room": "Room 1"}, [1, 6]),
+            ({"format": "lightning-talk"}, [1, 3, 5, 7]),
+            ({"language": "no"}, [0, 3, 6]),
+        ],
+    )
+    def test_filter(self, client, params, expected):
+        resp = client.get("/api/v1/sessions", params=params)
+
+        assert resp.status_code == 200
+        assert [uuid.UUID(session["id"]).int - 1 for session in resp.json()] == expected
+
+
+def _three_slots(i):
+    return datetime(2025, 9, 3, 9) + timedelta(hours=i % 3)
+
+
+def _pages(client, url):
+    pages = []
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        pages.append([uuid.UUID(session["id"]).int - 1 for session in resp.json()])
+        link = resp.headers.get("Link")
+        url = None
+        if link:
+            target, rel = link.split(";")
+            assert rel.strip() == 'rel="next"'
+            url = target.strip().removeprefix("<").removesuffix(">")
+    return pages
+
+
+class TestSessionsPagination:
+    def test_pages_with_equal_start_times(self, client):
+        seed_sessions(10, start_time=_three_slots)
+        everything = _pages(client, "/api/v1/sessions?sort=start_time")[0]
+
+        pages = _pages(client, "/api/v1/sessions?limit=3")
+
+        assert [len(page) for page in pages] == [3, 3, 3, 1]
+        assert sum(pages, []) == everything
+        assert everything == [0, 3, 6, 9, 1, 4, 7, 2, 5, 8]
+
+    def test_sessions_without_start_time_come_last(self, client):
+        seed_sessions(7, start_time=lambda i: _three_slots(i) if i < 4 else None)
+
+        pages = _pages(client, "/api/v1/sessions?limit=2")
+
+        assert pages == [[0, 3], [1, 2], [4, 5], [6]]
+
+    def test_no_link_on_last_page(self, client):
+        seed_sessions(3)
+
+        resp = client.get("/api/v1/sessions", params={"limit": 3})
+
+        assert resp.status_code == 200
+        assert "Link" not in resp.headers
+
+    @pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24=", "WzEsIDJd", "WyJub3QgYSBkYXRlIiwgIngiXQ=="])
+    def test_invalid_cursor(self, client, cursor):
+        seed_sessions(3)
+
+        resp = client.get("/api/v1/sessions", params={"limit": 2, "cursor": cursor})
+
+        assert resp.status_code == 400
+
+    def test_only_sorted_by_start_time(self, client):
+        resp = client.get("/api/v1/sessions", params={"limit": 2, "sort": "title"})
+
+        assert resp.status_code == 400
+
+
+class TestSessionsProjection:
+    def test_fields(self, client):
+        seed_sessions(2)
+
+        resp = client.get("/api/v1/sessions", params={"fields": "id, title,startTime"})
+
+        assert resp.status_code == 200
+        assert resp.json() == [
+            {"id": str(uuid.UUID(int=1)), "title": "Session 0", "startTime": "2025-09-03T09:00:00"},
+            {"id": str(uuid.UUID(int=2)), "title": "Session 1", "startTime": "2025-09-03T10:00:00"},
+        ]
+
+    def test_single_session_fields(self, client):
+        seed_sessions(1)
+
+        resp = client.get(f"/api/v1/sessions/{uuid.UUID(int=1)}", params={"fields": "room"})
+
+        assert resp.json() == {"room": "Room 0"}
+
+    @pytest.mark.parametrize("path", ["/api/v1/sessions", f"/api/v1/sessions/{uuid.UUID(int=1)}"])
+    def test_unknown_fields(self, client, path):
+        seed_sessions(1)
+
+        resp = client.get(path, params={"fields": "title,secret"})
+
+        assert resp.status_code == 400
+        assert resp.json()["detail"] == "Unknown fields: secret"
+
+
+@pytest.mark.parametrize("path, status", [("/api/v1/sessions", 405), ("/api/v1/email_queue", 404)])
+def test_no_background_work_triggers(client, path, status):
+    assert client.post(path).status_code == status
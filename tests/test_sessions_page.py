@@ -0,0 +1,18 @@
+import pytest
+
+from conftest import seed_sessions
+
+AUTH = {"Authorization": "Bearer dummy"}
+
+
+class TestSessionsPage:
+    @pytest.mark.parametrize("path", ["/sessions", "/user/sessions"])
+    def test_query_count_does_not_grow_with_program(self, client, path):
+        counts = []
+        for count, attendees in ((5, 2), (40, 10)):
+            seed_sessions(count, attendees)
+            client.get(path, headers=AUTH)
+            resp = client.get(path, headers=AUTH)
+            assert resp.status_code == 200
+            counts.append(int(resp.headers["X-Query-Count"]))
+        assert counts[0] == counts[1]
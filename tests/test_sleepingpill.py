@@ -0,0 +1,214 @@
+import json
+import uuid
+from unittest import mock
+
+import pytest
+import requests
+from sqlalchemy.dialects import postgresql
+
+from ibidem.javazone import sleepingpill
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.database import get_session, models
+
+
+def _program(*titles):
+    sessions = []
+    for i, title in enumerate(titles):
+        session_id = str(uuid.UUID(int=i + 1))
+        sessions.append(
+            {
+                "sessionId": session_id,
+                "id": session_id,
+                "conferenceId": str(uuid.UUID(int=0)),
+                "intendedAudience": "Everyone",
+                "length": 45,
+                "format": "presentation",
+                "language": "en",
+                "abstract": "Abstract",
+                "title": title,
+                "speakers": [{"name": "Speaker"}],
+            }
+        )
+    return json.dumps({"sessions": sessions}).encode("utf-8")
+
+
+class FakeSleepingpill:
+    """Serves a program, answering conditional requests the way Sleepingpill does"""
+
+    def __init__(self):
+        self.body = _program()
+        self.etag = None
+        self.requests = []
+
+    def get(self, url, headers, **kwargs):
+        self.requests.append(headers)
+        resp = mock.MagicMock()
+        resp.__enter__.return_value = resp
+        if self.etag and headers.get("If-None-Match") == self.etag:
+            resp.status_code = requests.codes.not_modified
+        else:
+            resp.status_code = requests.codes.ok
+            resp.headers = {"ETag": self.etag} if self.etag else {}
+            resp.iter_content.return_value = [self.body]
+        return resp
+
+
+@pytest.fixture
+def sleepingpill_server(monkeypatch):
+    server = FakeSleepingpill()
+    monkeypatch.setattr(sleepingpill.requests, "get", server.get)
+    return server
+
+
+@pytest.fixture
+def db():
+    db = get_session()
+    db.execute(models.user_session.delete())
+    db.query(models.Session).delete()
+    db.query(models.SyncState).delete()
+    db.commit()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def diff(monkeypatch):
+    diff = mock.Mock(wraps=sleepingpill._update_sessions)
+    monkeypatch.setattr(sleepingpill, "_update_sessions", diff)
+    return diff
+
+
+def _titles(db):
+    return sorted(session.title for session in db.query(models.Session))
+
+
+class TestUpdateSessions:
+    def test_not_modified(self, sleepingpill_server, db, diff):
+        sleepingpill_server.body = _program("One", "Two")
+        sleepingpill_server.etag = '"v1"'
+        sleepingpill.update_sessions(db)
+        assert diff.call_count == 1
+        assert _titles(db) == ["One", "Two"]
+
+        sleepingpill.update_sessions(db)
+
+        assert sleepingpill_server.requests[-1]["If-None-Match"] == '"v1"'
+        assert diff.call_count == 1
+
+    def test_unchanged_digest(self, sleepingpill_server, db, diff):
+        sleepingpill_server.body = _program("One")
+        sleepingpill.update_sessions(db)
+        sleepingpill.update_sessions(db)
+        assert diff.call_count == 1
+
+        sleepingpill_server.body = _program("One", "Two")
+        sleepingpill.update_sessions(db)
+
+        assert diff.call_count == 2
+        assert _titles(db) == ["One", "Two"]
+
+    def test_new_generation_syncs_everything(self, sleepingpill_server, db, diff, monkeypatch):
+        sleepingpill_server.body = _program("One")
+        sleepingpill_server.etag = '"v1"'
+        sleepingpill.update_sessions(db)
+
+        monkeypatch.setattr(settings, "update_generation", settings.update_generation + 1)
+        sleepingpill.update_sessions(db)
+
+        assert "If-None-Match" not in sleepingpill_server.requests[-1]
+        assert diff.call_count == 2
+
+    def test_missing_sessions_aborts(self, sleepingpill_server, db, diff):
+        sleepingpill_server.body = _program("One", "Two")
+        sleepingpill.update_sessions(db)
+        queued = db.query(models.EmailQueue).count()
+
+        sleepingpill_server.body = b'{"error": "Internal error"}'
+        with pytest.raises(ValueError):
+            sleepingpill.update_sessions(db)
+        db.rollback()
+
+        assert _titles(db) == ["One", "Two"]
+        assert db.query(models.EmailQueue).count() == queued
+
+    def test_notifies_web_processes(self, sleepingpill_server, db, diff, monkeypatch):
+        notify = mock.Mock(return_value=None)
+        monkeypatch.setattr(sleepingpill, "notify", notify)
+        sleepingpill_server.body = _program("One")
+        sleepingpill.update_sessions(db)
+        sleepingpill.update_sessions(db)
+
+        assert notify.call_args_list == [mock.call(db, models.Session.__table__)]
+
+    def test_queues_emails_to_attendees(self, sleepingpill_server, db, diff):
+        sleepingpill_server.body = _program("One", "Two", "Three")
+        sleepingpill.update_sessions(db)
+        one, two, three = (uuid.UUID(int=i) for i in (1, 2, 3))
+        db.query(models.EmailQueue).delete()
+        db.query(models.SessionSnapshot).delete()
+        db.query(models.User).delete()
+        db.add_all([models.User(email="a@example.com", name="A"), models.User(email="b@example.com", name="B")])
+        db.flush()
+        db.execute(
+            models.user_session.insert(),
+            [
+                {"user_email": "a@example.com", "session_id": one},
+                {"user_email": "a@example.com", "session_id": two},
+                {"user_email": "b@example.com", "session_id": one},
+                {"user_email": "b@example.com", "session_id": three},
+            ],
+        )
+        db.commit()
+        removed_hash = db.get(models.Session, two).hash
+
+        program = json.loads(_program("One, changed", "Two", "Three"))
+        del program["sessions"][1]
+        sleepingpill_server.body = json.dumps(program).encode("utf-8")
+        sleepingpill.update_sessions(db)
+
+        changed_hash = db.get(models.Session, one).hash
+        queued = db.query(models.EmailQueue).all()
+        assert sorted((eq.user_email, eq.action.name, eq.session_id, eq.session_hash) for eq in queued) == [
+            ("a@example.com", "CANCEL", two, removed_hash),
+            ("a@example.com", "UPDATE", one, changed_hash),
+            ("b@example.com", "UPDATE", one, changed_hash),
+        ]
+        assert len({eq.id for eq in queued}) == 3
+        snapshots = {snapshot.hash: json.loads(snapshot.data)["title"] for snapshot in db.query(models.SessionSnapshot)}
+        assert snapshots == {changed_hash: "One, changed", removed_hash: "Two"}
+        assert _titles(db) == ["One, changed", "Three"]
+        assert sorted(db.execute(models.user_session.select()).all()) == [
+            ("a@example.com", one),
+            ("b@example.com", one),
+            ("b@example.com", three),
+        ]
+
+    def test_queue_emails_on_postgresql(self):
+        db = mock.Mock()
+        db.get_bind.return_value.dialect = postgresql.dialect()
+
+        sleepingpill._queue_emails([uuid.UUID(int=1)], models.Action.CANCEL, db)
+
+        sql = [str(call.args[0].compile(dialect=postgresql.dialect())) for call in db.execute.call_args_list]
+        assert "ON CONFLICT (hash) DO NOTHING" in sql[0]
+        assert "gen_random_uuid()" in sql[1]
+        assert "CAST(%(param_1)s AS action)" in sql[1]
+        assert "pg_notify" in sql[2]
+
+
+def test_columns_fit_in_database():
+    raw = json.loads(_program("T" * 300))["sessions"][0]
+    raw.update(room="R" * 200, format="F" * 100, language="L" * 20)
+
+    columns = sleepingpill._columns(raw)
+
+    assert columns["title"] == "T" * 256
+    assert columns["room"] == "R" * 128
+    assert columns["format"] == "F" * 64
+    assert columns["language"] == "L" * 16
+
+
+def test_columns_without_room():
+    raw = json.loads(_program("Title"))["sessions"][0]
+
+    assert sleepingpill._columns(raw)["room"] is None
@@ -0,0 +1,170 @@
+import datetime
+import functools
+import ipaddress
+import smtplib
+import socket
+import ssl
+import time
+from email.message import EmailMessage
+from unittest import mock
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from pydantic import SecretStr
+
+from ibidem.javazone.core.config import settings
+from ibidem.javazone.mail import smtp
+
+
+class Handler:
+    """Accepts every message, and remembers which connection it came in on"""
+
+    def __init__(self):
+        self.messages = []
+        self.connections = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if server not in self.connections:
+            self.connections.append(server)
+        self.messages.append((self.connections.index(server), envelope.rcpt_tos))
+        return "250 OK"
+
+
+def _serve(monkeypatch, **kwargs) -> Handler:
+    handler = Handler()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    handler.controller = Controller(handler, hostname="127.0.0.1", port=port, **kwargs)
+    handler.controller.start()
+    monkeypatch.setattr(settings.mail.smtp, "host", "127.0.0.1")
+    monkeypatch.setattr(settings.mail.smtp, "port", port)
+    monkeypatch.setattr(settings.mail.smtp, "ssl", False)
+    monkeypatch.setattr(settings.mail.smtp, "max_messages_per_connection", 100)
+    return handler
+
+
+def _authenticator(success):
+    def authenticate(server, session, envelope, mechanism, auth_data):
+        return AuthResult(success=success, handled=False)
+
+    return authenticate
+
+
+def _certificate(directory):
+    """A self-signed certificate for 127.0.0.1, returning the paths to it and its key"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    return cert_path, key_path
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    handler = _serve(monkeypatch)
+    yield handler
+    handler.controller.stop()
+
+
+@pytest.fixture
+def credentials(monkeypatch):
+    monkeypatch.setattr(settings.mail.smtp, "username", "calendar")
+    monkeypatch.setattr(settings.mail.smtp, "password", SecretStr("password"))
+
+
+@pytest.fixture
+def pool():
+    pool = smtp.ConnectionPool(2)
+    yield pool
+    pool.close()
+
+
+def _message(i: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = f"Message {i}"
+    msg["From"] = "sender@example.com"
+    msg["To"] = f"{i}@example.com"
+    msg.set_content("Hello")
+    return msg
+
+
+def _drop_connections(handler: Handler):
+    for server in handler.connections:
+        handler.controller.loop.call_soon_threadsafe(server.transport.close)
+    time.sleep(0.1)
+
+
+def test_reuses_connection(handler, pool):
+    for i in range(3):
+        pool.send(_message(i))
+
+    assert handler.messages == [(0, [f"{i}@example.com"]) for i in range(3)]
+
+
+def test_retires_connection_after_max_messages(handler, pool, monkeypatch):
+    monkeypatch.setattr(settings.mail.smtp, "max_messages_per_connection", 2)
+    for i in range(5):
+        pool.send(_message(i))
+
+    assert [connection for connection, _ in handler.messages] == [0, 0, 1, 1, 2]
+
+
+def test_reconnects_when_server_drops_connection(handler, pool):
+    pool.send(_message(0))
+    _drop_connections(handler)
+    pool.send(_message(1))
+    pool.send(_message(2))
+
+    assert handler.messages == [(0, ["0@example.com"]), (1, ["1@example.com"]), (1, ["2@example.com"])]
+
+
+def test_starttls_before_login(monkeypatch, credentials, tmp_path):
+    cert_path, key_path = _certificate(tmp_path)
+    tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    tls_context.load_cert_chain(cert_path, key_path)
+    handler = _serve(monkeypatch, tls_context=tls_context, require_starttls=True, authenticator=_authenticator(True))
+    monkeypatch.setattr(
+        smtp.ssl, "create_default_context", functools.partial(ssl.create_default_context, cafile=cert_path)
+    )
+    pool = smtp.ConnectionPool(1)
+    try:
+        pool.send(_message(0))
+    finally:
+        pool.close()
+        handler.controller.stop()
+
+    assert handler.messages == [(0, ["0@example.com"])]
+
+
+def test_closes_connection_when_login_fails(monkeypatch, credentials):
+    handler = _serve(monkeypatch, auth_require_tls=False, authenticator=_authenticator(False))
+    close = mock.patch.object(smtplib.SMTP, "close", autospec=True, side_effect=smtplib.SMTP.close)
+    try:
+        with close as closed, pytest.raises(smtplib.SMTPAuthenticationError):
+            smtp.Connection()
+    finally:
+        handler.controller.stop()
+
+    assert closed.called
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from ibidem.javazone.database import count_queries, get_async_session, get_session, models
+from ibidem.javazone.http import schemas
+from ibidem.javazone.services import users
+
+EMAIL = "someone@example.com"
+
+
+@pytest.fixture(autouse=True)
+def forget_user():
+    users.known_users.forget(EMAIL)
+    yield
+    users.known_users.forget(EMAIL)
+    db = get_session()
+    try:
+        db.query(models.User).filter(models.User.email == EMAIL).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _resolve(*authenticated: schemas.AuthenticatedUser) -> list[int]:
+    """Resolve each user in turn, returning the number of queries each took"""
+
+    async def resolve():
+        counts = []
+        async with get_async_session() as db:
+            for user in authenticated:
+                with count_queries() as counter:
+                    await users.resolve_user(user, db)
+                counts.append(counter.count)
+        # Pooled connections belong to this event loop
+        await db.bind.dispose()
+        return counts
+
+    return asyncio.run(resolve())
+
+
+def _stored_name() -> str:
+    db = get_session()
+    try:
+        return db.get(models.User, EMAIL).name
+    finally:
+        db.close()
+
+
+def test_cached_user_makes_no_queries():
+    user = schemas.AuthenticatedUser(email=EMAIL, name="Someone")
+
+    first, second = _resolve(user, user)
+
+    assert first > 0
+    assert second == 0
+    assert _stored_name() == "Someone"
+
+
+def test_name_change_updates_stored_user():
+    _resolve(schemas.AuthenticatedUser(email=EMAIL, name="Someone"))
+    _resolve(schemas.AuthenticatedUser(email=EMAIL, name="Someone Else"))
+
+    assert _stored_name() == "Someone Else"